@@ -0,0 +1,20 @@
+"""
+Benchmarks for the API. Run them from the repository root, e.g.
+
+    $ python -m benchmarks.serialization --rows 100000
+"""
+import os
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def load_app(database_url):
+    """
+    Imports src/app.py against the given database (app.py reads DATABASE_URL at import time).
+    """
+    os.environ["DATABASE_URL"] = database_url
+    if SRC not in sys.path:
+        sys.path.insert(0, SRC)
+    from app import app
+    return app
@@ -0,0 +1,136 @@
+"""
+Seeded synthetic dataset for the User/Planet/Specie/Character/Favorite schema.
+
+--scale is the number of characters; the other tables are sized from it (see
+sizes()), so 1000 gives a small local dataset and 1000000 a large one. The same
+seed and scale always produce the same rows and ids, which benchmarks.load relies on.
+
+    $ python -m benchmarks.dataset --scale 100000 --database-url sqlite:////tmp/bench.db --reset
+"""
+import argparse
+import json
+import random
+import time
+from benchmarks import load_app
+
+CLIMATES = ["arid", "temperate", "frozen", "tropical", "murky", "windy", "rocky", "oceanic"]
+BATCH_SIZE = 10000
+
+
+def sizes(scale):
+    return {
+        "planet": max(1, scale // 20),
+        "specie": max(1, scale // 50),
+        "user": max(1, scale // 10),
+        "character": scale,
+        "favorite": scale,
+    }
+
+
+def planets(rng, count):
+    for i in range(1, count + 1):
+        yield {"id": i, "name": "Planet %d" % i, "clima": rng.choice(CLIMATES)}
+
+
+def species(rng, count, planet_count):
+    for i in range(1, count + 1):
+        yield {"id": i, "name": "Specie %d" % i, "planet_id": rng.randint(1, planet_count)}
+
+
+def users(count):
+    for i in range(1, count + 1):
+        yield {"id": i, "name": "user%d" % i, "email": "user%d@example.com" % i}
+
+
+def characters(rng, count, planet_count, specie_count):
+    for i in range(1, count + 1):
+        yield {"id": i, "name": "Character %d" % i,
+               "planet_id": rng.randint(1, planet_count), "specie_id": rng.randint(1, specie_count)}
+
+
+def favorites(rng, n):
+    """
+    Spreads n favorites over the users without repeating a (user, target) pair.
+    Targets are drawn from characters, planets and species in proportion to their size.
+    """
+    targets = n["character"] + n["planet"] + n["specie"]
+    per_user, remainder = divmod(n["favorite"], n["user"])
+    next_id = 1
+    for user_id in range(1, n["user"] + 1):
+        wanted = min(per_user + (1 if user_id <= remainder else 0), targets)
+        for index in rng.sample(range(targets), wanted):
+            row = {"id": next_id, "user_id": user_id, "character_id": None, "planet_id": None, "specie_id": None}
+            if index < n["character"]:
+                row["character_id"] = index + 1
+            elif index < n["character"] + n["planet"]:
+                row["planet_id"] = index - n["character"] + 1
+            else:
+                row["specie_id"] = index - n["character"] - n["planet"] + 1
+            next_id += 1
+            yield row
+
+
+def insert_batches(db, table, rows):
+    from sqlalchemy import insert
+    batch = []
+    total = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            db.session.execute(insert(table), batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(table), batch)
+        total += len(batch)
+    return total
+
+
+def generate(db, models, scale, seed):
+    rng = random.Random(seed)
+    n = sizes(scale)
+    steps = [
+        (models.Planet, planets(rng, n["planet"])),
+        (models.Specie, species(rng, n["specie"], n["planet"])),
+        (models.User, users(n["user"])),
+        (models.Character, characters(rng, n["character"], n["planet"], n["specie"])),
+        (models.Favorite, favorites(rng, n)),
+    ]
+    counts = {}
+    for model, rows in steps:
+        started = time.perf_counter()
+        counts[model.__tablename__] = insert_batches(db, model.__table__, rows)
+        db.session.commit()
+        print("%-10s %8d rows in %.1fs" % (model.__tablename__, counts[model.__tablename__], time.perf_counter() - started))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=int, default=1000, help="number of characters (1000 to 1000000)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", default="sqlite:////tmp/bench.db")
+    parser.add_argument("--reset", action="store_true", help="drop and recreate every table first")
+    args = parser.parse_args()
+
+    app = load_app(args.database_url)
+    import models
+    from models import db
+    from sqlalchemy import func, select
+
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        if db.session.execute(select(func.count()).select_from(models.Character)).scalar():
+            raise SystemExit("The character table is not empty, use --reset on a benchmark database")
+        counts = generate(db, models, args.scale, args.seed)
+        # The rows went in with plain inserts, which do not maintain the favorite counters
+        from favorites import rebuild_counts
+        rebuild_counts()
+
+    print(json.dumps({"scale": args.scale, "seed": args.seed, "rows": counts}))
+
+
+if __name__ == "__main__":
+    main()
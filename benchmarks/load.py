@@ -0,0 +1,198 @@
+"""
+Replays a read/write mix against a running API and reports latency percentiles and throughput as JSON.
+
+The ids it asks for come from benchmarks.dataset.sizes(), so point it at a server
+whose database was filled with the same --scale:
+
+    $ python -m benchmarks.dataset --scale 100000 --database-url sqlite:////tmp/bench.db --reset
+    $ DATABASE_URL=sqlite:////tmp/bench.db gunicorn wsgi --chdir ./src/ -b 127.0.0.1:3000 -w 4
+    $ python -m benchmarks.load --scale 100000 --duration 30 --concurrency 16 --output before.json
+
+Writes only add and remove favorites and rename characters to the name the
+generator gave them, so repeated runs see the same dataset. Requests that
+answer 5xx or fail at the connection level are counted as errors; 4xx answers
+(an already deleted favorite, for instance) are part of the mix. Every worker
+thread comes from the same address, so leave LIMIT_RATE unset on the server;
+429 and 503 answers show up in the status counts.
+"""
+import argparse
+import base64
+import http.client
+import json
+import random
+import subprocess
+import threading
+import time
+from urllib.parse import urlsplit
+from benchmarks.dataset import sizes
+
+# (name, weight, request builder); builders take (rng, n) and return (method, path, body)
+OPERATIONS = [
+    ("GET /characters", 15, lambda rng, n: ("GET", "/characters?limit=100", None)),
+    ("GET /characters?after", 10, lambda rng, n: ("GET", "/characters?limit=100&after=%s" % cursor(rng.randint(1, n["character"])), None)),
+    ("GET /characters?fields", 5, lambda rng, n: ("GET", "/characters?limit=100&fields=name", None)),
+    ("GET /character/<id>", 20, lambda rng, n: ("GET", "/character/%d" % rng.randint(1, n["character"]), None)),
+    ("GET /planet/<id>", 8, lambda rng, n: ("GET", "/planet/%d" % rng.randint(1, n["planet"]), None)),
+    ("GET /specie/<id>", 5, lambda rng, n: ("GET", "/specie/%d" % rng.randint(1, n["specie"]), None)),
+    ("GET /planets", 4, lambda rng, n: ("GET", "/planets?limit=100", None)),
+    ("GET /species", 3, lambda rng, n: ("GET", "/species?limit=100", None)),
+    ("GET /user/<id>/favorites", 12, lambda rng, n: ("GET", "/user/%d/favorites" % rng.randint(1, n["user"]), None)),
+    ("GET /user/<id>/favorites?expand", 5, lambda rng, n: ("GET", "/user/%d/favorites?expand=character,planet,specie" % rng.randint(1, n["user"]), None)),
+    ("GET /user/<id>", 3, lambda rng, n: ("GET", "/user/%d" % rng.randint(1, n["user"]), None)),
+    ("POST /favorite/character/<id>", 4, lambda rng, n: ("POST", "/favorite/character/%d" % rng.randint(1, n["character"]),
+                                                         {"user_id": rng.randint(1, n["user"])})),
+    ("DELETE /favorite/character/<id>", 3, lambda rng, n: ("DELETE", "/favorite/character/%d" % rng.randint(1, n["character"]),
+                                                           {"user_id": rng.randint(1, n["user"])})),
+    ("PUT /character/<id>", 3, lambda rng, n: rename(rng.randint(1, n["character"]))),
+]
+
+
+def cursor(entity_id):
+    # Same encoding as listing.encode_cursor
+    return base64.urlsafe_b64encode(str(entity_id).encode()).decode().rstrip("=")
+
+
+def rename(character_id):
+    return "PUT", "/character/%d" % character_id, {"name": "Character %d" % character_id}
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, seconds):
+    latencies = sorted(latency for latency, _ in samples)
+    statuses = {}
+    errors = 0
+    for _, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+        if status == "error" or status >= 500:
+            errors += 1
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": round(len(samples) / seconds, 1) if seconds else None,
+        "latency_ms": {name: round(percentile(latencies, pct) * 1000, 2) if latencies else None
+                       for name, pct in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "status": statuses,
+    }
+
+
+class Worker(threading.Thread):
+    """
+    One keep-alive connection replaying weighted random operations until the deadline.
+    """
+
+    def __init__(self, base_url, n, seed, warmup_until, deadline):
+        super().__init__(daemon=True)
+        self.url = urlsplit(base_url)
+        self.n = n
+        self.rng = random.Random(seed)
+        self.warmup_until = warmup_until
+        self.deadline = deadline
+        self.samples = {}
+        self.connection = None
+
+    def connect(self):
+        cls = http.client.HTTPSConnection if self.url.scheme == "https" else http.client.HTTPConnection
+        self.connection = cls(self.url.hostname, self.url.port, timeout=30)
+
+    def send(self, method, path, body):
+        headers = {"Accept": "application/json"}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        # Servers without keep-alive (gunicorn sync workers) close the socket after each
+        # response, so a failure on a reused connection is retried once on a new one
+        for attempt in (0, 1):
+            if self.connection is None:
+                self.connect()
+            try:
+                self.connection.request(method, self.url.path.rstrip("/") + path, payload, headers)
+                response = self.connection.getresponse()
+                response.read()
+                if response.getheader("Connection", "").lower() == "close":
+                    self.connection.close()
+                    self.connection = None
+                return response.status
+            except (http.client.HTTPException, OSError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+    def run(self):
+        names = [name for name, _, _ in OPERATIONS]
+        weights = [weight for _, weight, _ in OPERATIONS]
+        builders = dict((name, build) for name, _, build in OPERATIONS)
+        while True:
+            started = time.perf_counter()
+            if started >= self.deadline:
+                break
+            name = self.rng.choices(names, weights)[0]
+            method, path, body = builders[name](self.rng, self.n)
+            try:
+                status = self.send(method, path, body)
+            except (http.client.HTTPException, OSError):
+                status = "error"
+            finished = time.perf_counter()
+            if started >= self.warmup_until:
+                self.samples.setdefault(name, []).append((finished - started, status))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default="http://127.0.0.1:3000")
+    parser.add_argument("--scale", type=int, default=1000, help="the --scale the dataset was generated with")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="seconds run before measuring")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args()
+
+    n = sizes(args.scale)
+    start = time.perf_counter()
+    warmup_until = start + args.warmup
+    deadline = warmup_until + args.duration
+    workers = [Worker(args.base_url, n, args.seed + i, warmup_until, deadline) for i in range(args.concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    by_operation = {}
+    for worker in workers:
+        for name, samples in worker.samples.items():
+            by_operation.setdefault(name, []).extend(samples)
+
+    report = {
+        "commit": git_commit(),
+        "base_url": args.base_url,
+        "scale": args.scale,
+        "seed": args.seed,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "total": summarize([sample for samples in by_operation.values() for sample in samples], args.duration),
+        "operations": {name: summarize(by_operation[name], args.duration) for name, _, _ in OPERATIONS if name in by_operation},
+    }
+    body = json.dumps(report, indent=2)
+    print(body)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(body + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compares the two ways of building a collection response:
+
+* orm:  Character entities -> serialize() -> Flask's default JSON provider
+* fast: column rows -> dicts -> the provider registered on the app (JSON_PROVIDER)
+
+Both must produce the same bytes; the script exits with status 1 if they do not.
+
+    $ python -m benchmarks.serialization --rows 100000 --repeat 5
+"""
+import argparse
+import json
+import statistics
+import time
+from benchmarks import load_app
+
+
+def seed(db, models, rows):
+    from sqlalchemy import insert
+    db.create_all()
+    db.session.execute(insert(models.Planet), [{"id": 1, "name": "Tatooine", "clima": "arid"}])
+    db.session.execute(insert(models.Specie), [{"id": 1, "name": "Human", "planet_id": 1}])
+    db.session.execute(insert(models.Character), [
+        {"name": "Character %d" % i, "planet_id": 1, "specie_id": 1} for i in range(rows)
+    ])
+    db.session.commit()
+
+
+def orm_body(app, db, models):
+    from flask.json.provider import DefaultJSONProvider
+    from sqlalchemy import select
+    Character = models.Character
+    query_results = db.session.execute(select(Character).order_by(Character.id)).scalars().all()
+    results = list(map(lambda character: character.serialize(), query_results))
+    body = {"msg": "Hello, this is your GET /characters response ", "results": results, "next": None}
+    return DefaultJSONProvider(app).response(body).get_data()
+
+
+def fast_body(app, db, models):
+    from listing import column_names, field_statement
+    Character = models.Character
+    rows = db.session.execute(field_statement(Character, column_names(Character)).order_by(Character.id))
+    results = [row._asdict() for row in rows]
+    body = {"msg": "Hello, this is your GET /characters response ", "results": results, "next": None}
+    return app.json.response(body).get_data()
+
+
+def measure(fn, repeat):
+    timings = []
+    body = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = fn()
+        timings.append(time.perf_counter() - started)
+    return body, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--database-url", default="sqlite://")
+    args = parser.parse_args()
+
+    app = load_app(args.database_url)
+    import models
+    from models import db
+
+    with app.app_context():
+        seed(db, models, args.rows)
+
+        def run(build):
+            # A fresh session each time so identity-map hits do not flatter the ORM path
+            db.session.remove()
+            return build(app, db, models)
+
+        orm, orm_times = measure(lambda: run(orm_body), args.repeat)
+        fast, fast_times = measure(lambda: run(fast_body), args.repeat)
+
+    report = {
+        "rows": args.rows,
+        "json_provider": type(app.json).__name__,
+        "identical": orm == fast,
+        "bytes": len(fast),
+        "orm_seconds": {"median": statistics.median(orm_times), "min": min(orm_times)},
+        "fast_seconds": {"median": statistics.median(fast_times), "min": min(fast_times)},
+        "speedup": statistics.median(orm_times) / statistics.median(fast_times),
+    }
+    print(json.dumps(report, indent=2))
+    if not report["identical"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""user unique email and name
+
+Revision ID: 3f8a2c6d9e15
+Revises: 9c3e7d21b4a6
+Create Date: 2026-10-18 10:41:09.562871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a2c6d9e15'
+down_revision = '9c3e7d21b4a6'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = ('email', 'name')
+# How many duplicated values the error lists per column
+SHOWN = 10
+
+
+def duplicated_values(column):
+    user = sa.table('user', sa.column(column))
+    count = sa.func.count()
+    stmt = sa.select(user.c[column], count).group_by(user.c[column]).having(count > 1).order_by(count.desc(), user.c[column])
+    return op.get_bind().execute(stmt.limit(SHOWN + 1)).all()
+
+
+def upgrade():
+    # Users are not merged here (their favorites would have to follow): a database holding
+    # duplicates, from before the unique check moved into the database, must be fixed by hand
+    problems = []
+    for column in COLUMNS:
+        rows = duplicated_values(column)
+        if rows:
+            shown = ', '.join('%r (%d users)' % (value, count) for value, count in rows[:SHOWN])
+            problems.append('%s: %s%s' % (column, shown, ', ...' if len(rows) > SHOWN else ''))
+    if problems:
+        raise RuntimeError('Cannot create the unique indexes on user, these values are taken by more than one '
+                           'user. Rename or merge those users, then run the upgrade again.\n  ' + '\n  '.join(problems))
+
+    op.create_index('ix_user_email', 'user', ['email'], unique=True)
+    op.create_index('ix_user_name', 'user', ['name'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_user_name', table_name='user')
+    op.drop_index('ix_user_email', table_name='user')
@@ -0,0 +1,37 @@
+"""favorite unique targets
+
+Revision ID: 518a9b805bfd
+Revises: f15b51c0230f
+Create Date: 2026-10-18 09:12:31.402115
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '518a9b805bfd'
+down_revision = 'f15b51c0230f'
+branch_labels = None
+depends_on = None
+
+TARGETS = ('character_id', 'planet_id', 'specie_id')
+
+
+def upgrade():
+    # Keep the oldest row of any duplicated favorite so the unique indexes can be built
+    for column in TARGETS:
+        op.execute(
+            'DELETE FROM favorite WHERE {col} IS NOT NULL AND id NOT IN '
+            '(SELECT MIN(id) FROM favorite WHERE {col} IS NOT NULL GROUP BY user_id, {col})'.format(col=column)
+        )
+
+    for column in TARGETS:
+        where = sa.text('{} IS NOT NULL'.format(column))
+        op.create_index('uq_favorite_user_{}'.format(column), 'favorite', ['user_id', column], unique=True,
+                        postgresql_where=where, sqlite_where=where)
+
+
+def downgrade():
+    for column in TARGETS:
+        op.drop_index('uq_favorite_user_{}'.format(column), table_name='favorite')
@@ -0,0 +1,53 @@
+"""name search indexes
+
+Revision ID: 7d2f5b8c1a64
+Revises: c47e1b9a0d38
+Create Date: 2026-10-18 14:02:17.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2f5b8c1a64'
+down_revision = 'c47e1b9a0d38'
+branch_labels = None
+depends_on = None
+
+TABLES = ('character', 'planet', 'specie')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        # Trigram GIN indexes serve name ILIKE '%...%' for substrings of 3+ characters
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table in TABLES:
+            op.create_index('ix_%s_name_trgm' % table, table, ['name'], unique=False,
+                            postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    elif dialect == 'sqlite':
+        # External-content FTS5 tables (rowid = id) kept in sync by triggers
+        for table in TABLES:
+            op.execute("CREATE VIRTUAL TABLE %s_fts USING fts5(name, content='%s', content_rowid='id', tokenize='trigram')"
+                       % (table, table))
+            op.execute('CREATE TRIGGER %(t)s_fts_insert AFTER INSERT ON "%(t)s" BEGIN '
+                       'INSERT INTO %(t)s_fts(rowid, name) VALUES (new.id, new.name); END' % {'t': table})
+            op.execute('CREATE TRIGGER %(t)s_fts_delete AFTER DELETE ON "%(t)s" BEGIN '
+                       "INSERT INTO %(t)s_fts(%(t)s_fts, rowid, name) VALUES ('delete', old.id, old.name); END" % {'t': table})
+            op.execute('CREATE TRIGGER %(t)s_fts_update AFTER UPDATE OF name ON "%(t)s" BEGIN '
+                       "INSERT INTO %(t)s_fts(%(t)s_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+                       'INSERT INTO %(t)s_fts(rowid, name) VALUES (new.id, new.name); END' % {'t': table})
+            op.execute("INSERT INTO %(t)s_fts(%(t)s_fts) VALUES ('rebuild')" % {'t': table})
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table in TABLES:
+            op.drop_index('ix_%s_name_trgm' % table, table_name=table)
+    elif dialect == 'sqlite':
+        for table in TABLES:
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute('DROP TRIGGER IF EXISTS %s_fts_%s' % (table, trigger))
+            op.execute('DROP TABLE IF EXISTS %s_fts' % table)
@@ -0,0 +1,36 @@
+"""foreign key indexes
+
+Revision ID: 9c3e7d21b4a6
+Revises: 518a9b805bfd
+Create Date: 2026-10-18 10:03:47.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3e7d21b4a6'
+down_revision = '518a9b805bfd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_favorite_user_id_id', 'favorite', ['user_id', 'id'], unique=False)
+    op.create_index('ix_favorite_character_id', 'favorite', ['character_id'], unique=False)
+    op.create_index('ix_favorite_planet_id', 'favorite', ['planet_id'], unique=False)
+    op.create_index('ix_favorite_specie_id', 'favorite', ['specie_id'], unique=False)
+    op.create_index('ix_character_planet_id', 'character', ['planet_id'], unique=False)
+    op.create_index('ix_character_specie_id', 'character', ['specie_id'], unique=False)
+    op.create_index('ix_specie_planet_id', 'specie', ['planet_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_specie_planet_id', table_name='specie')
+    op.drop_index('ix_character_specie_id', table_name='character')
+    op.drop_index('ix_character_planet_id', table_name='character')
+    op.drop_index('ix_favorite_specie_id', table_name='favorite')
+    op.drop_index('ix_favorite_planet_id', table_name='favorite')
+    op.drop_index('ix_favorite_character_id', table_name='favorite')
+    op.drop_index('ix_favorite_user_id_id', table_name='favorite')
@@ -0,0 +1,47 @@
+"""table version slots
+
+Revision ID: a3d8c5e1f7b2
+Revises: e6b3d94f2c17
+Create Date: 2026-10-18 19:12:40.318265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d8c5e1f7b2'
+down_revision = 'e6b3d94f2c17'
+branch_labels = None
+depends_on = None
+
+# Must match versioning.VERSION_SLOTS
+SLOTS = 16
+TABLES = ('user', 'character', 'planet', 'specie', 'favorite', 'favorite_count')
+
+
+def upgrade():
+    # Versions carry over into slot 0, so the sums, and the ETags built on them, stay the same
+    versions = dict(op.get_bind().execute(sa.text("SELECT table_name, version FROM table_version")).fetchall())
+    op.drop_table('table_version')
+    table_version = op.create_table('table_version',
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('slot', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name', 'slot')
+    )
+    op.bulk_insert(table_version, [
+        {'table_name': name, 'slot': slot, 'version': versions.get(name, 0) if slot == 0 else 0}
+        for name in sorted(set(TABLES) | set(versions)) for slot in range(SLOTS)
+    ])
+
+
+def downgrade():
+    versions = op.get_bind().execute(sa.text("SELECT table_name, sum(version) FROM table_version GROUP BY table_name")).fetchall()
+    op.drop_table('table_version')
+    table_version = op.create_table('table_version',
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(table_version, [{'table_name': name, 'version': int(version)} for name, version in versions])
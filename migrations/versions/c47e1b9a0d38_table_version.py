@@ -0,0 +1,32 @@
+"""table version counters
+
+Revision ID: c47e1b9a0d38
+Revises: 3f8a2c6d9e15
+Create Date: 2026-10-18 11:26:54.730912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47e1b9a0d38'
+down_revision = '3f8a2c6d9e15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    table_version = op.create_table('table_version',
+    sa.Column('table_name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(table_version, [
+        {'table_name': name, 'version': 1}
+        for name in ('user', 'character', 'planet', 'specie', 'favorite')
+    ])
+
+
+def downgrade():
+    op.drop_table('table_version')
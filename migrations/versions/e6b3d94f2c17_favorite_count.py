@@ -0,0 +1,37 @@
+"""favorite counters
+
+Revision ID: e6b3d94f2c17
+Revises: 7d2f5b8c1a64
+Create Date: 2026-10-18 15:47:31.602734
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b3d94f2c17'
+down_revision = '7d2f5b8c1a64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('favorite_count',
+    sa.Column('target_type', sa.String(length=20), nullable=False),
+    sa.Column('target_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('target_type', 'target_id')
+    )
+    op.create_index('ix_favorite_count_top', 'favorite_count', ['target_type', sa.text('count DESC'), 'target_id'], unique=False)
+    for target_type in ('character', 'planet', 'specie'):
+        op.execute(
+            "INSERT INTO favorite_count (target_type, target_id, count) "
+            "SELECT '%(type)s', %(type)s_id, count(*) FROM favorite WHERE %(type)s_id IS NOT NULL GROUP BY %(type)s_id"
+            % {'type': target_type}
+        )
+
+
+def downgrade():
+    op.drop_index('ix_favorite_count_top', table_name='favorite_count')
+    op.drop_table('favorite_count')
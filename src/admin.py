@@ -1,14 +1,32 @@
+"""
+Flask-Admin UI at /admin, skipped entirely when ADMIN_ENABLED=false.
+
+Flask-Admin and its ModelViews are imported and built on the first request
+under /admin, not when the API boots, so workers that never serve the admin
+do not pay for it. Flask does not accept new blueprints once it has handled a
+request, so the admin lives in a Flask app of its own, configured like the API
+(same database settings, its own connection pool), and AdminDispatcher sends
+/admin requests to it.
+"""
 import os
-from flask_admin import Admin
+import threading
+from flask import Flask
+from config import configure_database
 from models import db, User, Character, Planet, Specie, Favorite
-from flask_admin.contrib.sqla import ModelView
 
-def setup_admin(app):
-    app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
-    app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
-    admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
+PREFIX = "/admin"
+
+
+def create_admin_app(app):
+    from flask_admin import Admin
+    from flask_admin.contrib.sqla import ModelView
+
+    admin_app = Flask(app.import_name, static_folder=None)
+    admin_app.secret_key = app.secret_key
+    admin_app.config['FLASK_ADMIN_SWATCH'] = app.config['FLASK_ADMIN_SWATCH']
+    configure_database(admin_app, db)
+    admin = Admin(admin_app, name='4Geeks Admin', template_mode='bootstrap3')
 
-    
     # Add your models here, for example this is how we add a the User model to the admin
     admin.add_view(ModelView(User, db.session))
     admin.add_view(ModelView(Character, db.session))
@@ -17,4 +35,36 @@ def setup_admin(app):
     admin.add_view(ModelView(Favorite, db.session))
 
     # You can duplicate that line to add mew models
-    # admin.add_view(ModelView(YourModelName, db.session))
\ No newline at end of file
+    # admin.add_view(ModelView(YourModelName, db.session))
+    return admin_app
+
+
+class AdminDispatcher:
+    """
+    WSGI middleware in front of the API app, building the admin app on first use.
+    """
+
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self.admin_app = None
+        self._lock = threading.Lock()
+
+    def get_admin_app(self):
+        if self.admin_app is None:
+            with self._lock:
+                if self.admin_app is None:
+                    self.admin_app = create_admin_app(self.app)
+        return self.admin_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == PREFIX or path.startswith(PREFIX + "/"):
+            return self.get_admin_app()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+
+def setup_admin(app):
+    app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
+    app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
+    app.wsgi_app = AdminDispatcher(app, app.wsgi_app)
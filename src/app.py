@@ -2,35 +2,191 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+from flask import Flask, request, jsonify, url_for, Response, stream_with_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from utils import APIException, generate_sitemap
+from config import configure_database, env_bool
 from admin import setup_admin
-from models import db, User, Character, Planet, Specie, Favorite
+from commands import setup_commands
+from cache import EntityCache
+from bulk import parse_batch, insert_batch, CONFLICT as BATCH_CONFLICT, INVALID as BATCH_INVALID
+from favorites import add_favorite, remove_favorite, top_favorites, apply_batch, TARGETS, EXISTS, USER_NOT_FOUND, \
+    TARGET_NOT_FOUND, CONFLICT
+from versioning import conditional, request_version
+from metrics import init_metrics
+from logger import setup_logging
+from json_provider import setup_json
+from compress import setup_compression
+from limiter import setup_limiter
+from health import init_health
+from search import parse_query, parse_types, name_criterion, search
+from listing import parse_page, page_statement, page_results, parse_expand, expand_options, serialize_expanded, \
+    parse_fields, field_statement, column_names, project, parse_filters, parse_limit
+from models import db, User, Character, Planet, Specie, Favorite, FavoriteCount
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 #from models import Person
 
 app = Flask(__name__)
 app.url_map.strict_slashes = False
 
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-MIGRATE = Migrate(app, db)
-db.init_app(app)
+app.config['API_DEFAULT_PAGE_SIZE'] = int(os.getenv("API_DEFAULT_PAGE_SIZE", 100))
+app.config['API_MAX_PAGE_SIZE'] = int(os.getenv("API_MAX_PAGE_SIZE", 1000))
+app.config['API_STREAM_BATCH_SIZE'] = int(os.getenv("API_STREAM_BATCH_SIZE", 1000))
+app.config['API_MAX_BATCH_SIZE'] = int(os.getenv("API_MAX_BATCH_SIZE", 1000))
+app.config['ENTITY_CACHE_SIZE'] = int(os.getenv("ENTITY_CACHE_SIZE", 10000))
+app.config['ENTITY_CACHE_TTL'] = float(os.getenv("ENTITY_CACHE_TTL", 60))
+app.config['LOG_LEVEL'] = os.getenv("LOG_LEVEL", "INFO").upper()
+app.config['LOG_SAMPLE_RATES'] = os.getenv("LOG_SAMPLE_RATES", "default=1")
+app.config['JSON_PROVIDER'] = os.getenv("JSON_PROVIDER", "auto")
+app.config['SEARCH_MIN_LENGTH'] = int(os.getenv("SEARCH_MIN_LENGTH", 3))
+app.config['SEARCH_DEFAULT_LIMIT'] = int(os.getenv("SEARCH_DEFAULT_LIMIT", 20))
+app.config['SEARCH_MAX_LIMIT'] = int(os.getenv("SEARCH_MAX_LIMIT", 100))
+app.config['FAVORITES_TOP_DEFAULT_LIMIT'] = int(os.getenv("FAVORITES_TOP_DEFAULT_LIMIT", 10))
+app.config['FAVORITES_TOP_MAX_LIMIT'] = int(os.getenv("FAVORITES_TOP_MAX_LIMIT", 100))
+app.config['COMPRESS_ALGORITHMS'] = os.getenv("COMPRESS_ALGORITHMS", "zstd,br,gzip")
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+app.config['COMPRESS_GZIP_LEVEL'] = int(os.getenv("COMPRESS_GZIP_LEVEL", 6))
+app.config['COMPRESS_BROTLI_LEVEL'] = int(os.getenv("COMPRESS_BROTLI_LEVEL", 4))
+app.config['COMPRESS_ZSTD_LEVEL'] = int(os.getenv("COMPRESS_ZSTD_LEVEL", 3))
+app.config['COMPRESS_CACHE_SIZE'] = int(os.getenv("COMPRESS_CACHE_SIZE", 256))
+app.config['COMPRESS_STREAM_FLUSH_SIZE'] = int(os.getenv("COMPRESS_STREAM_FLUSH_SIZE", 65536))
+app.config['LIMIT_CONCURRENCY'] = os.getenv("LIMIT_CONCURRENCY", "")
+app.config['LIMIT_RATE'] = os.getenv("LIMIT_RATE", "")
+app.config['LIMIT_MAX_CLIENTS'] = int(os.getenv("LIMIT_MAX_CLIENTS", 10000))
+app.config['TRUSTED_PROXIES'] = int(os.getenv("TRUSTED_PROXIES", 0))
+app.config['READY_CHECK_INTERVAL'] = float(os.getenv("READY_CHECK_INTERVAL", 5))
+app.config['ADMIN_ENABLED'] = env_bool("ADMIN_ENABLED", True)
+
+logger = setup_logging(app)
+setup_json(app)
+configure_database(app, db)
 CORS(app)
-setup_admin(app)
+if app.config['ADMIN_ENABLED']:
+    setup_admin(app)
+setup_commands(app)
+entity_cache = EntityCache(app.config['ENTITY_CACHE_SIZE'], app.config['ENTITY_CACHE_TTL'])
+metrics = init_metrics(app)
+metrics.add_collector(entity_cache.metric_lines)
+compression = setup_compression(app)
+metrics.add_collector(compression.metric_lines)
+# Collection endpoints read whole pages or whole tables, they get the "scan" limits
+limiter = setup_limiter(app, ("get_users", "get_characters", "get_planets", "get_species", "get_favorites",
+                              "get_user_favorites", "search_names", "get_top_favorites"))
+metrics.add_collector(limiter.metric_lines)
+init_health(app)
+# Outermost, so every layer below sees the client address and scheme the proxies reported
+if app.config['TRUSTED_PROXIES']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'], x_proto=app.config['TRUSTED_PROXIES'])
 
 # Handle/serialize errors like a JSON object
 @app.errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
+# ?limit= / ?after= for every collection endpoint
+def request_page():
+    return parse_page(request.args, app.config['API_DEFAULT_PAGE_SIZE'], app.config['API_MAX_PAGE_SIZE'])
+
+def fetch_page(stmt, id_column, page):
+    rows = db.session.execute(page_statement(stmt, id_column, page)).scalars().all()
+    return page_results(rows, page)
+
+# Read fast path: select plain column rows (only the ?fields= ones when given)
+# instead of hydrating ORM instances and calling serialize() on each of them.
+# The dicts have the same keys as serialize(), so the JSON is identical.
+def fetch_rows(model, fields, page, *criteria):
+    stmt = field_statement(model, fields or column_names(model)).where(*criteria)
+    rows = db.session.execute(page_statement(stmt, model.id, page)).all()
+    rows, next_cursor = page_results(rows, page)
+    return [row._asdict() for row in rows], next_cursor
+
+# Full-table exports: ?stream=1 or Accept: application/x-ndjson
+def wants_stream():
+    if request.args.get("stream") in ("1", "true"):
+        return True
+    return request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"]) == "application/x-ndjson"
+
+def stream_collection(model, fields, *criteria):
+    # yield_per keeps a server-side cursor open and only hydrates one batch
+    # at a time, so worker memory stays flat whatever the table size.
+    stmt = field_statement(model, fields or column_names(model)).where(*criteria).order_by(model.id)
+    stmt = stmt.execution_options(stream_results=True, yield_per=app.config['API_STREAM_BATCH_SIZE'])
+
+    def generate():
+        for row in db.session.execute(stmt):
+            yield app.json.dumps(row._asdict(), separators=(",", ":")) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# ?planet_id= / ?specie_id= / ... and ?id__in= of the collection endpoints
+def request_filters(model, allowed=()):
+    return parse_filters(request.args, model, allowed, app.config['API_MAX_PAGE_SIZE'])
+
+# ?name= substring filter of the catalogue collections, served by the search indexes
+def name_filter(model):
+    value = parse_query(request.args, "name")
+    return [] if value is None else [name_criterion(model, value)]
+
+# Single-entity GETs read through entity_cache, under the table version @conditional
+# read for the ETag, so the body never predates the ETag; PUT/DELETE handlers invalidate it.
+# ?expand= bypasses the cache and loads the relationships in one query each
+# ?fields= is answered from the cache when the entity is there, otherwise with a column-only select
+def get_serialized(model, entity_id, expand=(), fields=None):
+    if expand:
+        stmt = select(model).where(model.id == entity_id).options(*expand_options(model, expand))
+        entity = db.session.execute(stmt).scalar_one_or_none()
+        if entity is None:
+            return None
+        result = serialize_expanded(entity, expand)
+        return project(result, fields, expand) if fields else result
+
+    version = request_version(model)
+    result = entity_cache.get(model.__tablename__, entity_id, version) if version is not None else None
+    if result is not None:
+        return project(result, fields) if fields else result
+
+    row = db.session.execute(field_statement(model, fields or column_names(model)).where(model.id == entity_id)).first()
+    if row is None:
+        return None
+    result = row._asdict()
+    if not fields and version is not None:
+        entity_cache.set(model.__tablename__, entity_id, version, result)
+    return result
+
+# DELETE /<entity>/<id>: the foreign keys refuse to delete a row other rows still point at
+def commit_delete(entity):
+    db.session.delete(entity)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+# POST /<collection>/batch
+def request_batch():
+    return parse_batch(request.get_json(silent=True), app.config['API_MAX_BATCH_SIZE'])
+
+def batch_response(msg, status, results):
+    if status == BATCH_CONFLICT:
+        return jsonify({"error": "Batch conflicts with a concurrent change, retry it"}), 409
+    if status == BATCH_INVALID:
+        return jsonify({"error": "Batch rejected by the database, nothing was created"}), 400
+    created = sum(1 for result in results if result["status"] == "created")
+    response_body = {
+        "msg": msg,
+        "created": created,
+        "failed": len(results) - created,
+        "results": results
+    }
+    return jsonify(response_body), 201 if created else 400
+
+@app.route("/cache/stats", methods=["GET"])
+def get_cache_stats():
+    return jsonify(entity_cache.stats()), 200
+
 # generate sitemap with all your endpoints
 @app.route('/')
 def sitemap():
@@ -45,18 +201,45 @@ def sitemap():
 
 #     return jsonify(response_body), 200
 
+# -------------------------------------------------
+# SEARCH
+# -------------------------------------------------
+@app.route("/search", methods=["GET"])
+@conditional(Character, Planet, Specie)
+def search_names():
+    query = parse_query(request.args, "q")
+    if query is None:
+        raise APIException("q is required", status_code=400)
+    types = parse_types(request.args)
+    limit = parse_limit(request.args, app.config['SEARCH_DEFAULT_LIMIT'], app.config['SEARCH_MAX_LIMIT'])
+    try:
+        response_body = {
+            "msg": "Hello, this is your GET /search response ",
+            "q": query,
+            "results": search(query, types, limit)
+        }
+        return jsonify(response_body), 200
+    except Exception as e:
+        return jsonify({"error": "Internal error", "message": str(e)}), 500
+
 # -------------------------------------------------
 # USERS
 # -------------------------------------------------
 @app.route("/users", methods=["GET"])
+@conditional(User)
 def get_users():
+    fields = parse_fields(request.args, User)
+    criteria = request_filters(User)
+    if wants_stream():
+        return stream_collection(User, fields, *criteria)
+    page = request_page()
     try:
-        query_results = User.query.all()
-        results = list(map(lambda user: user.serialize(), query_results))
+        results, next_cursor = fetch_rows(User, fields, page, *criteria)
     
         response_body ={
             "msg": "Hello, this is your GET /users response ",
-            "results":results
+            "results":results,
+            "next": next_cursor
         }
 
         return jsonify(response_body), 200
@@ -68,19 +251,22 @@ def get_users():
 def add_users():
     try:
         data = request.json
-        print(data)
-        existing_user = User.query.filter((User.email == data.get("email")) | (User.name == data.get("name"))).first()
-    
-        if existing_user:
-            return jsonify({"msg": "user already exists"}), 400
+        logger.debug("add_users payload: %s", data)
+        if not data.get("name") or not data.get("email"):
+            return jsonify({"msg": "name and email are required"}), 400
 
         new_user = User(
             name=data.get("name"),
             email=data.get("email")
         )
 
-        db.session.add(new_user)
-        db.session.commit()
+        # The unique indexes on email and name reject duplicates, no lookup needed
+        try:
+            db.session.add(new_user)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"msg": "user already exists"}), 400
 
         return jsonify({"msg": "User added successfully", "user": new_user.serialize()}), 200
     
@@ -88,14 +274,30 @@ def add_users():
         return jsonify({"error": "Internal error", "message": str(e)}), 500
 
 
+@app.route("/users/batch", methods=["POST"])
+def add_users_batch():
+    items = request_batch()
+    try:
+        status, results = insert_batch(User, items, ["name", "email"], unique=["email", "name"])
+        return batch_response("Users added", status, results)
+
+    except Exception as e:
+        return jsonify({"error": "Internal error", "message": str(e)}), 500
+
+
 @app.route("/user/<int:user_id>", methods=["GET"])
+@conditional(User, expand=("favorites",))
 def get_user(user_id):
+    expand = parse_expand(request.args, ("favorites",))
+    fields = parse_fields(request.args, User)
     try:
-        query_result = User.query.filter_by(id = user_id).first()
-        print(query_result)
+        result = get_serialized(User, user_id, expand, fields)
+        logger.debug("get_user result: %s", result)
+        if result is None:
+            return jsonify({"msg": "User not found"}), 404
         response_body = {
             "msg": "Hello, this is your GET /user/user_id response ",
-            "result":query_result.serialize()
+            "result":result
         }
         return jsonify(response_body), 200
     
@@ -111,8 +313,9 @@ def delete_user(user_id):
         if not user:
             return jsonify({"msg": "User not found"}), 404
         
-        db.session.delete(user)
-        db.session.commit()
+        if not commit_delete(user):
+            return jsonify({"msg": "User still has favorites"}), 409
+        entity_cache.invalidate("user", user_id)
         
         return jsonify({"msg": "User deleted successfully"}), 200
     
@@ -120,26 +323,60 @@ def delete_user(user_id):
         return jsonify({"error": "Internal error", "message": str(e)}), 500
 
 
+# PUT /user/<id> body: the fields present must be non-empty strings that fit their column
+def user_changes(data):
+    if not isinstance(data, dict):
+        raise APIException("Request body must be a JSON object", status_code=400)
+    changes = {}
+    for field in ("name", "email"):
+        if field not in data:
+            continue
+        value = data[field]
+        if not isinstance(value, str) or not value.strip():
+            raise APIException(f"{field} must be a non-empty string", status_code=400)
+        length = User.__table__.c[field].type.length
+        if len(value) > length:
+            raise APIException(f"{field} must be at most {length} characters", status_code=400)
+        changes[field] = value
+    return changes
+
+# Unique indexes on user (migration 3f8a2c6d9e15) and the field each one guards
+USER_UNIQUE_INDEXES = {"ix_user_email": "email", "ix_user_name": "name"}
+
+# The field an IntegrityError on user is about: the constraint name where the driver
+# reports it (PostgreSQL), otherwise a lookup of the new values (SQLite). Call after rollback.
+def conflicting_user_field(error, user_id, changes):
+    constraint = getattr(getattr(error.orig, "diag", None), "constraint_name", None)
+    if constraint is not None:
+        return USER_UNIQUE_INDEXES.get(constraint)
+    for field in ("email", "name"):
+        if field in changes:
+            taken = db.session.execute(select(User.id).where(getattr(User, field) == changes[field], User.id != user_id)).first()
+            if taken:
+                return field
+    return None
+
 @app.route("/user/<int:user_id>", methods=["PUT"])
 def edit_user(user_id):
+    changes = user_changes(request.get_json(silent=True))
     try:
         user = User.query.get(user_id)
 
         if not user:
             return jsonify({"msg": "User not found"}), 404
 
-        data = request.json
-
-        existing_user = User.query.filter(User.email == data.get("email"), User.id != user_id).first()
-        if existing_user:
-            return jsonify({"msg":"Another user with that email already exists"}), 400
-        
-        if "name" in data:
-            user.name = data["name"]
-        if "email" in data:
-            user.email = data["email"]
-
-        db.session.commit()
+        for field, value in changes.items():
+            setattr(user, field, value)
+
+        try:
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            field = conflicting_user_field(e, user_id, changes)
+            if field is None:
+                raise
+            return jsonify({"msg": f"Another user with that {field} already exists"}), 400
+        entity_cache.invalidate("user", user_id)
         
         return jsonify({"msg": "User updated successfully", "user": user.serialize()}), 200
     
@@ -150,15 +387,21 @@ def edit_user(user_id):
 # CHARACTERS
 # -------------------------------------------------
 @app.route("/characters", methods=["GET"])
+@conditional(Character)
 def get_characters():
+    fields = parse_fields(request.args, Character)
+    criteria = name_filter(Character) + request_filters(Character, ("planet_id", "specie_id"))
+    if wants_stream():
+        return stream_collection(Character, fields, *criteria)
+    page = request_page()
     try:
-        query_results  = Character.query.all()
-        results = list(map(lambda character: character.serialize(), query_results))
-        print(results)
+        results, next_cursor = fetch_rows(Character, fields, page, *criteria)
+        logger.debug("get_characters results: %s", results)
 
         response_body = {
             "msg": "Hello, this is your GET /characters response ",
-            "results":results
+            "results":results,
+            "next": next_cursor
         }
         return jsonify(response_body), 200
     
@@ -167,13 +410,18 @@ def get_characters():
 
 
 @app.route("/character/<int:character_id>", methods=["GET"])
+@conditional(Character, expand=("planet", "specie"))
 def get_character(character_id):
+    expand = parse_expand(request.args, ("planet", "specie"))
+    fields = parse_fields(request.args, Character)
     try:
-        query_result = Character.query.filter_by(id = character_id).first()
-        print(query_result)
+        result = get_serialized(Character, character_id, expand, fields)
+        logger.debug("get_character result: %s", result)
+        if result is None:
+            return jsonify({"error":"Personaje no encontrado"}), 404
         response_body = {
             "msg": "Hello, this is your GET /character/character_id response ",
-            "result":query_result.serialize()
+            "result":result
         }
         return jsonify(response_body), 200
     
@@ -203,6 +451,16 @@ def add_character():
         return jsonify({"error": "Error al crear personaje", "message": str(e)}), 500
 
 
+@app.route("/characters/batch", methods=["POST"])
+def add_characters_batch():
+    items = request_batch()
+    try:
+        status, results = insert_batch(Character, items, ["name", "specie_id", "planet_id"], {"specie_id": Specie, "planet_id": Planet})
+        return batch_response("Personajes creados", status, results)
+    except Exception as e:
+        return jsonify({"error": "Error al crear personajes", "message": str(e)}), 500
+
+
 @app.route("/character/<int:character_id>", methods=["PUT"])
 def edit_character(character_id):
     try:
@@ -225,6 +483,7 @@ def edit_character(character_id):
             character.planet_id = planet_id
 
         db.session.commit()
+        entity_cache.invalidate("character", character_id)
 
         return jsonify({"msg":"Personaje actualizado", "personaje": character.serialize()}), 200
     except Exception as e:
@@ -238,8 +497,9 @@ def delete_character(character_id):
         if not character:
             return jsonify({"error":"Personaje no encontrado"}), 404
         
-        db.session.delete(character)
-        db.session.commit()
+        if not commit_delete(character):
+            return jsonify({"error": "Personaje en uso en favoritos"}), 409
+        entity_cache.invalidate("character", character_id)
 
         return jsonify({"msg":f"Personaje {character.name}, eliminado"}), 200
     except Exception as e:
@@ -249,28 +509,39 @@ def delete_character(character_id):
 # -------------------------------------------------
 
 @app.route("/planets", methods=["GET"])
+@conditional(Planet)
 def get_planets():
+    fields = parse_fields(request.args, Planet)
+    criteria = name_filter(Planet) + request_filters(Planet)
+    if wants_stream():
+        return stream_collection(Planet, fields, *criteria)
+    page = request_page()
     try:
-        query_results = Planet.query.all()
-        results = list(map(lambda planet: planet.serialize(), query_results))
-        print(results, "Soy el print planet")
+        results, next_cursor = fetch_rows(Planet, fields, page, *criteria)
+        logger.debug("get_planets results: %s", results)
         
         response_body = {
             "msg": "Hello, this is your GET /planets response ",
-            "results":results
+            "results":results,
+            "next": next_cursor
         }
         return jsonify(response_body), 200
     except Exception as e:
         return jsonify({"error": "Internal error", "message": str(e)}), 500
     
 @app.route("/planet/<int:planet_id>", methods=["GET"] )
+@conditional(Planet, expand=("characters", "species"))
 def get_planet(planet_id):
+    expand = parse_expand(request.args, ("characters", "species"))
+    fields = parse_fields(request.args, Planet)
     try:
-        query_result = Planet.query.filter_by(id = planet_id).first()
-        print(query_result, "Soy el print de PLanet ID")
+        result = get_serialized(Planet, planet_id, expand, fields)
+        logger.debug("get_planet result: %s", result)
+        if result is None:
+            return jsonify({"error":"Planeta no encontrado"}), 404
         response_body = {
             "msg": "hello, this is your GET /planet/planet_id response",
-            "result": query_result.serialize()
+            "result": result
         }
         return jsonify(response_body), 200
     
@@ -298,10 +569,20 @@ def add_planet():
     except Exception as e:
         return jsonify({"error": "Error al crear planeta", "message": str(e)}), 500
 
+@app.route("/planets/batch", methods=["POST"])
+def add_planets_batch():
+    items = request_batch()
+    try:
+        status, results = insert_batch(Planet, items, ["name", "clima"])
+        return batch_response("Planetas creados", status, results)
+    except Exception as e:
+        return jsonify({"error": "Error al crear planetas", "message": str(e)}), 500
+
+
 @app.route("/planet/<int:planet_id>", methods=["PUT"])
 def edit_planet(planet_id):
     try:
-        planet = planet.query.filter_by(id = planet_id).first()
+        planet = Planet.query.filter_by(id = planet_id).first()
 
         if not planet:
             return jsonify({"error":"Planeta no encontrado"}), 404
@@ -317,6 +598,7 @@ def edit_planet(planet_id):
             planet.clima = clima
 
         db.session.commit()
+        entity_cache.invalidate("planet", planet_id)
 
         return jsonify({"msg":"Planeta actualizado", "planeta": planet.serialize()}), 200
     except Exception as e:
@@ -330,8 +612,9 @@ def delete_planet(planet_id):
         if not planet:
             return jsonify({"error":"Planeta no encontrado"}), 404
         
-        db.session.delete(planet)
-        db.session.commit()
+        if not commit_delete(planet):
+            return jsonify({"error": "Planeta en uso por personajes o favoritos"}), 409
+        entity_cache.invalidate("planet", planet_id)
 
         return jsonify({"msg":f"Planeta {planet.name}, eliminado"}), 200
     except Exception as e:
@@ -341,13 +624,19 @@ def delete_planet(planet_id):
 # -------------------------------------------------
 
 @app.route("/species", methods=["GET"])
+@conditional(Specie)
 def get_species():
+    fields = parse_fields(request.args, Specie)
+    criteria = name_filter(Specie) + request_filters(Specie, ("planet_id",))
+    if wants_stream():
+        return stream_collection(Specie, fields, *criteria)
+    page = request_page()
     try:
-        query_results = Specie.query.all()
-        results = list(map(lambda specie: specie.serialize(), query_results))
+        results, next_cursor = fetch_rows(Specie, fields, page, *criteria)
         response_body = {
             "msg": "Hello, this is your GET /species response ",
-            "results":results
+            "results":results,
+            "next": next_cursor
         }
 
         return jsonify(response_body), 200
@@ -356,13 +645,18 @@ def get_species():
 
 
 @app.route("/specie/<int:specie_id>", methods=["GET"])
+@conditional(Specie, expand=("planet", "characters"))
 def get_specie(specie_id):
+    expand = parse_expand(request.args, ("planet", "characters"))
+    fields = parse_fields(request.args, Specie)
     try:
-        query_result = Specie.query.filter_by(id = specie_id).first()
-        print(query_result)
+        result = get_serialized(Specie, specie_id, expand, fields)
+        logger.debug("get_specie result: %s", result)
+        if result is None:
+            return jsonify({"error":"especie no encontrada"}), 404
         response_body = {
             "msg": "Hello, this is your GET /species/species_id response ",
-            "result":query_result.serialize()
+            "result":result
         }
         return jsonify(response_body), 200
     
@@ -390,6 +684,16 @@ def add_specie():
     except Exception as e:
         return jsonify({"error": "Error al crear especie", "message": str(e)})
     
+@app.route("/species/batch", methods=["POST"])
+def add_species_batch():
+    items = request_batch()
+    try:
+        status, results = insert_batch(Specie, items, ["name", "planet_id"], {"planet_id": Planet})
+        return batch_response("Especies creadas", status, results)
+    except Exception as e:
+        return jsonify({"error": "Error al crear especies", "message": str(e)}), 500
+
+
 @app.route("/specie/<int:specie_id>", methods=["PUT"])
 def edit_specie(specie_id):
     try:
@@ -409,6 +713,7 @@ def edit_specie(specie_id):
             specie.planet_id = planet_id
 
         db.session.commit()
+        entity_cache.invalidate("specie", specie_id)
 
         return jsonify({"msg":"especie actualizado", "especie": specie.serialize()}), 200
     except Exception as e:
@@ -417,13 +722,14 @@ def edit_specie(specie_id):
 @app.route("/specie/<int:specie_id>", methods=["DELETE"])
 def delete_specie(specie_id):
     try:
-        specie = specie.query.filter_by(id=specie_id).first()
+        specie = Specie.query.filter_by(id=specie_id).first()
 
         if not specie:
             return jsonify({"error":"especie no encontrada"}), 404
         
-        db.session.delete(specie)
-        db.session.commit()
+        if not commit_delete(specie):
+            return jsonify({"error": "especie en uso por personajes o favoritos"}), 409
+        entity_cache.invalidate("specie", specie_id)
 
         return jsonify({"msg":f"especie {specie.name}, eliminada"}), 200
     except Exception as e:
@@ -433,13 +739,19 @@ def delete_specie(specie_id):
 # -------------------------------------------------
 
 @app.route("/favorites", methods=["GET"])
+@conditional(Favorite)
 def get_favorites():
+    fields = parse_fields(request.args, Favorite)
+    criteria = request_filters(Favorite, ("user_id", "character_id", "planet_id", "specie_id"))
+    if wants_stream():
+        return stream_collection(Favorite, fields, *criteria)
+    page = request_page()
     try:
-        query_results = Favorite.query.all()
-        results = list(map(lambda favorite: favorite.serialize(), query_results))
+        results, next_cursor = fetch_rows(Favorite, fields, page, *criteria)
         response_body = {
             "msg": "Hello, this is your GET /favorites response",
-            "result": results
+            "result": results,
+            "next": next_cursor
         }
 
         return jsonify(response_body), 200
@@ -448,17 +760,51 @@ def get_favorites():
         return jsonify({"error": "Internal error", "message": str(e)}), 500
 
 
+@app.route("/favorites/top", methods=["GET"])
+@conditional(FavoriteCount, Character, Planet, Specie)
+def get_top_favorites():
+    target_type = request.args.get("type", "character")
+    if target_type not in TARGETS:
+        raise APIException("type must be one of: " + ", ".join(TARGETS), status_code=400)
+    limit = parse_limit(request.args, app.config['FAVORITES_TOP_DEFAULT_LIMIT'], app.config['FAVORITES_TOP_MAX_LIMIT'])
+    try:
+        response_body = {
+            "msg": "Hello, this is your GET /favorites/top response",
+            "type": target_type,
+            "result": top_favorites(target_type, limit)
+        }
+        return jsonify(response_body), 200
+    except Exception as e:
+        return jsonify({"error": "Internal error", "message": str(e)}), 500
+
+
 @app.route("/user/<int:user_id>/favorites", methods=["GET"])
+@conditional(Favorite, User, expand=("character", "planet", "specie"))
 def get_user_favorites(user_id):
+    fields = parse_fields(request.args, Favorite)
+    criteria = [Favorite.user_id == user_id] + request_filters(Favorite, ("character_id", "planet_id", "specie_id"))
+    stream = wants_stream()
+    if not stream:
+        page = request_page()
+        expand = parse_expand(request.args, ("character", "planet", "specie"))
     try:
-        user = User.query.filter_by(id=user_id).first()
-        if not user:
+        # Checked before the stream starts, its status cannot change afterwards
+        if db.session.execute(select(User.id).where(User.id == user_id)).first() is None:
             return jsonify({"error": "User not found"}), 404
-        favorites = Favorite.query.filter_by(user_id=user_id).all()
-        results = list(map(lambda favorite: favorite.serialize(), favorites))
+        if stream:
+            return stream_collection(Favorite, fields, *criteria)
+        if not expand:
+            results, next_cursor = fetch_rows(Favorite, fields, page, *criteria)
+        else:
+            stmt = select(Favorite).where(*criteria).options(*expand_options(Favorite, expand))
+            favorites, next_cursor = fetch_page(stmt, Favorite.id, page)
+            results = list(map(lambda favorite: serialize_expanded(favorite, expand), favorites))
+            if fields:
+                results = [project(result, fields, expand) for result in results]
         response_body = {
             "msg": "Hello, this is your GET /user/<user_id>/favorites response",
-            "result": results
+            "result": results,
+            "next": next_cursor
         }
 
         return jsonify(response_body), 200
@@ -468,68 +814,76 @@ def get_user_favorites(user_id):
 
 # POST
 
+# [{"op": "add" | "delete", "type": "character" | "planet" | "specie", "id": 1}, ...]
+# Each operation gets created / exists / deleted / error, or cancelled for an add undone later in the same batch
+@app.route("/user/<int:user_id>/favorites/batch", methods=["POST"])
+def batch_user_favorites(user_id):
+    operations = request_batch()
+    try:
+        status, results = apply_batch(user_id, operations)
+        if status == USER_NOT_FOUND:
+            return jsonify({"error": "User not found"}), 404
+        if status == CONFLICT:
+            return jsonify({"error": "Favorites changed during the batch, retry it"}), 409
+
+        failed = sum(1 for result in results if result["status"] == "error")
+        response_body = {
+            "msg": "Favorites batch applied",
+            "applied": len(results) - failed,
+            "failed": failed,
+            "results": results
+        }
+        return jsonify(response_body), 200 if failed < len(results) else 400
+    except Exception as e:
+        return jsonify({"error": "Internal error", "message": str(e)}), 500
+
 @app.route("/favorite/character/<int:character_id>", methods=["POST"])
 def add_favorite_character(character_id):
     try:
         user_id = request.json.get("user_id")
         if not user_id:
             return jsonify({"error": "User ID is required"}), 400
-        
-        user = User.query.get("user_id")
-        if user is None:
-            return jsonify({"erroe": "User not found"}), 404
+        if not isinstance(user_id, int) or isinstance(user_id, bool):
+            return jsonify({"error": "User ID must be an integer"}), 400
 
-        character = Character.query.get("character_id")
-        if character is None:
-            return jsonify({"error":"Character not found"}), 404
-        
-        existing_favorite = Favorite.query.filter_by(user_id = user_id, character_id= character_id).first()
-        if existing_favorite:
-            return jsonify({"msg":"Character already exists in user favorites"}), 200
-
-        new_favorite = Favorite(user_id=user_id, character_id=character_id)
-        db.session.add(new_favorite)
-        db.session.commit()
+        status, favorite = add_favorite(user_id, "character_id", character_id)
+        if status == USER_NOT_FOUND:
+            return jsonify({"error": "User not found"}), 404
+        if status == TARGET_NOT_FOUND:
+            return jsonify({"error": "Character not found"}), 404
+        if status == EXISTS:
+            return jsonify({"msg": "Character already exists in user favorites"}), 200
 
         response_body = {
             "msg": "Character added to favorites",
-            "favorite": new_favorite.serialize()
+            "favorite": favorite
         }
         return jsonify(response_body), 201
 
     except Exception as e:
         return jsonify({"error": "Internal error", "message": str(e)}), 500
-    
+
 
 @app.route("/favorite/planet/<int:planet_id>", methods=["POST"])
 def add_favorite_planet(planet_id):
     try:
         user_id = request.json.get("user_id")
         if not user_id:
-            return jsonify({"error":"User ID is required"}), 400
-        
-        # Verifico que exista usuario y planeta
-        user = User.query.get("user_id")
-        if user is None:
+            return jsonify({"error": "User ID is required"}), 400
+        if not isinstance(user_id, int) or isinstance(user_id, bool):
+            return jsonify({"error": "User ID must be an integer"}), 400
+
+        status, favorite = add_favorite(user_id, "planet_id", planet_id)
+        if status == USER_NOT_FOUND:
             return jsonify({"error": "User not found"}), 404
-        
-        planet = Planet.query.get("planet_id")
-        if planet is None:
-            return jsonify({"error":"Planet not found"}), 404
-        
-        # Compruebo si planeta ya se encuentra como favorito
-        existing_favorite = Favorite.query.filter_by(user_id=user_id, planet_id=planet_id).first()
-        if existing_favorite:
+        if status == TARGET_NOT_FOUND:
+            return jsonify({"error": "Planet not found"}), 404
+        if status == EXISTS:
             return jsonify({"msg": "planet already exists in user favorites"}), 200
-        
-        # Creamos un nuevo favorito
-        new_favorite = Favorite(user_id=user_id, planet_id=planet_id)
-        db.session.add(new_favorite)
-        db.session.commit()
 
         response_body = {
             "msg": "Planet added to favorites",
-            "favorite": new_favorite.serialize()
+            "favorite": favorite
         }
         return jsonify(response_body), 201
 
@@ -543,26 +897,20 @@ def add_favorite_specie(specie_id):
         user_id = request.json.get("user_id")
         if not user_id:
             return jsonify({"error": "User ID is required"}), 400
-        
-        user = User.query.get("user_id")
-        if user is None:
-            return jsonify({"erroe": "User not found"}), 404
+        if not isinstance(user_id, int) or isinstance(user_id, bool):
+            return jsonify({"error": "User ID must be an integer"}), 400
 
-        specie = specie.query.get("specie_id")
-        if specie is None:
-            return jsonify({"error":"specie not found"}), 404
-        
-        existing_favorite = Favorite.query.filter_by(user_id = user_id, specie_id= specie_id).first()
-        if existing_favorite:
-            return jsonify({"msg":"specie already exists in user favorites"}), 200
-
-        new_favorite = Favorite(user_id=user_id, specie_id=specie_id)
-        db.session.add(new_favorite)
-        db.session.commit()
+        status, favorite = add_favorite(user_id, "specie_id", specie_id)
+        if status == USER_NOT_FOUND:
+            return jsonify({"error": "User not found"}), 404
+        if status == TARGET_NOT_FOUND:
+            return jsonify({"error": "specie not found"}), 404
+        if status == EXISTS:
+            return jsonify({"msg": "specie already exists in user favorites"}), 200
 
         response_body = {
             "msg": "specie added to favorites",
-            "favorite": new_favorite.serialize()
+            "favorite": favorite
         }
         return jsonify(response_body), 201
 
@@ -591,7 +939,7 @@ def delete_favorite_planet(planet_id):
         if not favorite:
             return jsonify({"error": "Favorito no encontrado"}), 404
         
-        db.session.delete(favorite)
+        remove_favorite(favorite)
         db.session.commit()
 
         return jsonify({"msg": "Planeta eliminado de favoritos"}), 200
@@ -619,7 +967,7 @@ def delete_favorite_character(character_id):
         if not favorite:
             return jsonify({"error": "Favorito no encontrado"}), 404
         
-        db.session.delete(favorite)
+        remove_favorite(favorite)
         db.session.commit()
 
         return jsonify({"msg": "Personaje eliminado de favoritos"}), 200
@@ -647,7 +995,7 @@ def delete_favorite_specie(specie_id):
         if not favorite:
             return jsonify({"error": "Favorito no encontrado"}), 404
         
-        db.session.delete(favorite)
+        remove_favorite(favorite)
         db.session.commit()
 
         return jsonify({"msg": "Especie eliminada de favoritos"}), 200
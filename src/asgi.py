@@ -0,0 +1,266 @@
+"""
+ASGI entry point, the async counterpart of wsgi.py:
+
+    $ uvicorn asgi:application --app-dir src
+    $ gunicorn asgi:application -k uvicorn.workers.UvicornWorker --chdir ./src/
+
+The read endpoints (collections, details and a user's favorites) are served by
+async views on an async SQLAlchemy session (asyncpg / aiosqlite), so a single
+process can keep hundreds of slow reads in flight. They build their queries with
+the same helpers as app.py and return the same envelopes, byte for byte, with
+the same ETags, and go through the same admission control (limiter.py),
+compression (compress.py) and request metrics (metrics.py) as the Flask routes
+they stand for. Everything else (writes, ?expand=, ?name=, NDJSON streams,
+/search, /metrics, /admin) is handed to the Flask app, which runs in a thread
+pool.
+
+tests/test_parity.py runs the same requests against both entry points on a
+seeded database; `flask check-asgi-parity` does it against the current one.
+"""
+import time
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Mount, Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag, unquote_etag
+from app import app as flask_app, entity_cache, limiter, metrics, compression
+from config import database_url, engine_options, sqlite_pragma_listener
+from limiter import client_address, retry_after
+from metrics import request_statements
+from listing import parse_page, page_statement, page_results, parse_fields, field_statement, column_names, project, \
+    parse_filters
+from models import User, Character, Planet, Specie, Favorite
+from utils import APIException
+from versioning import versions_statement, make_etag
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(url):
+    scheme, _, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme.split("+")[0], scheme) + "://" + rest
+
+
+url = database_url()
+engine = create_async_engine(async_url(url), **engine_options(url))
+if url.startswith("sqlite"):
+    event.listen(engine.sync_engine, "connect", sqlite_pragma_listener())
+Session = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+flask_asgi = WSGIMiddleware(flask_app)
+
+
+def json_response(body, status_code=200):
+    # Same bytes as flask.jsonify: the app's JSON provider in compact mode plus a newline
+    content = flask_app.json.dumps(body, separators=(",", ":")) + "\n"
+    return Response(content, status_code=status_code, media_type="application/json")
+
+
+def wants_stream(request):
+    if request.query_params.get("stream") in ("1", "true"):
+        return True
+    accept = parse_accept_header(request.headers.get("accept"), MIMEAccept)
+    return accept.best_match(["application/json", "application/x-ndjson"]) == "application/x-ndjson"
+
+
+def request_page(request):
+    return parse_page(request.query_params, flask_app.config['API_DEFAULT_PAGE_SIZE'], flask_app.config['API_MAX_PAGE_SIZE'])
+
+
+def request_filters(request, model, allowed=()):
+    return parse_filters(request.query_params, model, allowed, flask_app.config['API_MAX_PAGE_SIZE'])
+
+
+def compress(request, response):
+    # compress.Compression for a buffered starlette response, sharing its LRU and counters
+    if not compression.preference or response.status_code != 200:
+        return response
+    response.headers["Vary"] = "Accept-Encoding"
+    encoding = compression.negotiate(parse_accept_header(request.headers.get("accept-encoding")))
+    if encoding is None or len(response.body) < compression.min_size:
+        return response
+    etag, weak = unquote_etag(response.headers.get("etag"))
+    response.body = compression.encode(response.body, encoding, etag)
+    response.headers["Content-Length"] = str(len(response.body))
+    response.headers["Content-Encoding"] = encoding
+    if etag:
+        response.headers["ETag"] = quote_etag(etag, weak=True)
+    return response
+
+
+async def fetch_rows(session, model, fields, page, *criteria):
+    stmt = field_statement(model, fields or column_names(model)).where(*criteria)
+    rows = (await session.execute(page_statement(stmt, model.id, page))).all()
+    rows, next_cursor = page_results(rows, page)
+    return [row._asdict() for row in rows], next_cursor
+
+
+async def get_serialized(session, model, entity_id, fields, version):
+    result = entity_cache.get(model.__tablename__, entity_id, version)
+    if result is not None:
+        return project(result, fields) if fields else result
+
+    stmt = field_statement(model, fields or column_names(model)).where(model.id == entity_id)
+    row = (await session.execute(stmt)).first()
+    if row is None:
+        return None
+    result = row._asdict()
+    if not fields:
+        entity_cache.set(model.__tablename__, entity_id, version, result)
+    return result
+
+
+class AsyncView:
+    """
+    ASGI endpoint that answers GETs with an async handler, adding the same
+    ETag / If-None-Match handling as @conditional and the admission control,
+    compression and metrics of the Flask endpoint it stands for, and forwards
+    every other method and the ?expand= / ?name= / streaming variants to the
+    Flask app.
+    """
+
+    def __init__(self, handler, endpoint, *models):
+        self.handler = handler
+        self.endpoint = endpoint
+        self.group = limiter.group("GET", endpoint)
+        self.tables = sorted(model.__tablename__ for model in models)
+
+    async def __call__(self, scope, receive, send):
+        request = Request(scope, receive)
+        if request.method != "GET" or "expand" in request.query_params or "name" in request.query_params or wants_stream(request):
+            await flask_asgi(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        statements = [0, 0.0]
+        token = request_statements.set(statements)
+        remote_addr = request.client.host if request.client else None
+        client = client_address(request.headers.get("x-forwarded-for"), remote_addr, flask_app.config['TRUSTED_PROXIES'])
+        rejection = limiter.enter(self.group, client)
+        try:
+            if rejection is not None:
+                status, message, wait = rejection
+                response = json_response({"message": message}, status)
+                response.headers["Retry-After"] = retry_after(wait)
+            else:
+                try:
+                    async with Session() as session:
+                        response = await self.respond(request, session)
+                except APIException as error:
+                    response = json_response(error.to_dict(), error.status_code)
+
+            response = compress(request, response)
+            # What flask_cors answers with CORS(app)'s defaults
+            if "origin" in request.headers:
+                response.headers["Access-Control-Allow-Origin"] = request.headers["origin"]
+                response.headers.append("Vary", "Origin")
+            else:
+                response.headers["Access-Control-Allow-Origin"] = "*"
+            metrics.record(self.endpoint, "GET", response.status_code, time.perf_counter() - started, *statements)
+            await response(scope, receive, send)
+        finally:
+            request_statements.reset(token)
+            if rejection is None:
+                limiter.leave(self.group)
+
+    async def respond(self, request, session):
+        versions = dict.fromkeys(self.tables, 0)
+        versions.update({row.table_name: row.version for row in await session.execute(versions_statement(self.tables))})
+        full_path = request.url.path + "?" + request.url.query
+        etag = make_etag(full_path, request.headers.get("accept", ""), versions)
+        request.state.table_versions = versions
+        if_none_match = parse_etags(request.headers.get("if-none-match"))
+        # As in @conditional, "*" only matches once the handler found the resource
+        if if_none_match.contains_weak(etag) and not if_none_match.star_tag:
+            return Response(status_code=304, headers={"ETag": quote_etag(etag)})
+
+        response = await self.handler(request, session, **request.path_params)
+        if response.status_code == 200:
+            if if_none_match.star_tag:
+                return Response(status_code=304, headers={"ETag": quote_etag(etag)})
+            response.headers["ETag"] = quote_etag(etag)
+        return response
+
+
+def collection(model, msg, key="results", filters=()):
+    async def handler(request, session):
+        fields = parse_fields(request.query_params, model)
+        criteria = request_filters(request, model, filters)
+        page = request_page(request)
+        try:
+            results, next_cursor = await fetch_rows(session, model, fields, page, *criteria)
+            return json_response({"msg": msg, key: results, "next": next_cursor})
+        except Exception as e:
+            return json_response({"error": "Internal error", "message": str(e)}, 500)
+    return handler
+
+
+def detail(model, msg, not_found):
+    async def handler(request, session, entity_id):
+        fields = parse_fields(request.query_params, model)
+        try:
+            result = await get_serialized(session, model, entity_id, fields, request.state.table_versions[model.__tablename__])
+            if result is None:
+                return json_response(not_found, 404)
+            return json_response({"msg": msg, "result": result})
+        except Exception as e:
+            return json_response({"error": "Internal error", "message": str(e)}, 500)
+    return handler
+
+
+async def user_favorites(request, session, user_id):
+    fields = parse_fields(request.query_params, Favorite)
+    criteria = [Favorite.user_id == user_id] + request_filters(request, Favorite, ("character_id", "planet_id", "specie_id"))
+    page = request_page(request)
+    try:
+        if await session.get(User, user_id) is None:
+            return json_response({"error": "User not found"}, 404)
+        results, next_cursor = await fetch_rows(session, Favorite, fields, page, *criteria)
+        return json_response({
+            "msg": "Hello, this is your GET /user/<user_id>/favorites response",
+            "result": results,
+            "next": next_cursor
+        })
+    except Exception as e:
+        return json_response({"error": "Internal error", "message": str(e)})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+application = Starlette(
+    routes=[
+        Route("/users", AsyncView(collection(User, "Hello, this is your GET /users response "), "get_users", User)),
+        Route("/user/{entity_id:int}", AsyncView(detail(User, "Hello, this is your GET /user/user_id response ",
+                                                        {"msg": "User not found"}), "get_user", User)),
+        Route("/user/{user_id:int}/favorites", AsyncView(user_favorites, "get_user_favorites", Favorite, User)),
+        Route("/characters", AsyncView(collection(Character, "Hello, this is your GET /characters response ",
+                                                  filters=("planet_id", "specie_id")), "get_characters", Character)),
+        Route("/character/{entity_id:int}", AsyncView(detail(Character, "Hello, this is your GET /character/character_id response ",
+                                                             {"error": "Personaje no encontrado"}), "get_character", Character)),
+        Route("/planets", AsyncView(collection(Planet, "Hello, this is your GET /planets response "), "get_planets", Planet)),
+        Route("/planet/{entity_id:int}", AsyncView(detail(Planet, "hello, this is your GET /planet/planet_id response",
+                                                          {"error": "Planeta no encontrado"}), "get_planet", Planet)),
+        Route("/species", AsyncView(collection(Specie, "Hello, this is your GET /species response ", filters=("planet_id",)),
+                                    "get_species", Specie)),
+        Route("/specie/{entity_id:int}", AsyncView(detail(Specie, "Hello, this is your GET /species/species_id response ",
+                                                          {"error": "especie no encontrada"}), "get_specie", Specie)),
+        Route("/favorites", AsyncView(collection(Favorite, "Hello, this is your GET /favorites response", key="result",
+                                                 filters=("user_id", "character_id", "planet_id", "specie_id")),
+                                      "get_favorites", Favorite)),
+        Mount("/", app=flask_asgi),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,183 @@
+"""
+Batch inserts used by the POST /<collection>/batch endpoints: every item is
+validated in one pass (required fields, types, string lengths), foreign keys and
+unique columns are checked with one set-based query per column, and the valid
+rows go to the database as a single executemany inside one transaction, with
+their ids assigned beforehand. If the database still refuses the batch (a row
+written by someone else between the checks and the insert), it is rolled back
+as a whole and reported with a status instead of the per-item results.
+"""
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DataError, IntegrityError
+from models import db
+from utils import APIException
+
+CREATED = "created"
+CONFLICT = "conflict"
+INVALID = "invalid"
+
+# Dialects whose insert() has on_conflict_do_nothing / on_conflict_do_update
+UPSERT_INSERTS = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert,
+}
+
+
+def parse_batch(data, max_size):
+    if not isinstance(data, list):
+        raise APIException("Request body must be a JSON array", status_code=400)
+    if not data:
+        raise APIException("Batch is empty", status_code=400)
+    if len(data) > max_size:
+        raise APIException(f"Batch too large, the maximum is {max_size} items", status_code=413)
+    return data
+
+
+def existing_values(column, values):
+    values = set(values)
+    if not values:
+        return set()
+    return set(db.session.execute(select(column).where(column.in_(values))).scalars())
+
+
+def column_types(model):
+    types = {}
+    for column in model.__table__.columns:
+        try:
+            types[column.key] = column.type.python_type
+        except NotImplementedError:
+            pass
+    return types
+
+
+def column_lengths(model):
+    return {column.key: column.type.length for column in model.__table__.columns
+            if getattr(column.type, "length", None) is not None}
+
+
+def too_long_fields(values, lengths):
+    return [field for field, value in values.items()
+            if field in lengths and isinstance(value, str) and len(value) > lengths[field]]
+
+
+def invalid_fields(values, types):
+    """
+    Fields whose value is not None nor of the column's type (JSON true/false do not pass for ints).
+    """
+    return [field for field, value in values.items()
+            if value is not None and field in types
+            and (not isinstance(value, types[field]) or (isinstance(value, bool) and types[field] is not bool))]
+
+
+def validate_batch(model, items, required, references=None, unique=()):
+    """
+    Returns (rows, results). rows are (index, values) pairs ready to insert,
+    results has one entry per item with the errors already filled in.
+    """
+    references = references or {}
+    columns = set(model.__table__.columns.keys()) - {"id"}
+    types = column_types(model)
+    lengths = column_lengths(model)
+    results = [None] * len(items)
+    candidates = []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = {"index": index, "status": "error", "error": "Item must be an object"}
+            continue
+        missing = [field for field in required if item.get(field) is None or item.get(field) == ""]
+        if missing:
+            results[index] = {"index": index, "status": "error", "error": "Faltan datos: " + ", ".join(missing)}
+            continue
+        values = {key: value for key, value in item.items() if key in columns}
+        invalid = invalid_fields(values, types)
+        bad_ids = [field for field in invalid if field in references]
+        if bad_ids:
+            results[index] = {"index": index, "status": "error", "error": "Invalid id: " + ", ".join(bad_ids)}
+            continue
+        if invalid:
+            results[index] = {"index": index, "status": "error", "error": "Invalid type: " + ", ".join(invalid)}
+            continue
+        too_long = too_long_fields(values, lengths)
+        if too_long:
+            results[index] = {"index": index, "status": "error", "error": "Too long: " + ", ".join(
+                "%s (max %d)" % (field, lengths[field]) for field in too_long)}
+            continue
+        candidates.append((index, values))
+
+    found = {}
+    for field, target in references.items():
+        found[field] = existing_values(target.id, (values[field] for _, values in candidates if values.get(field) is not None))
+    taken = {}
+    for field in unique:
+        taken[field] = existing_values(getattr(model, field), (values[field] for _, values in candidates))
+
+    rows = []
+    seen = {field: set() for field in unique}
+    for index, values in candidates:
+        missing = [field for field in references if values.get(field) is not None and values[field] not in found[field]]
+        if missing:
+            results[index] = {"index": index, "status": "error", "error": "Not found: " + ", ".join(missing)}
+            continue
+        duplicated = [field for field in unique if values[field] in taken[field] or values[field] in seen[field]]
+        if duplicated:
+            results[index] = {"index": index, "status": "error", "error": "Already exists: " + ", ".join(duplicated)}
+            continue
+        for field in unique:
+            seen[field].add(values[field])
+        rows.append((index, values))
+    return rows, results
+
+
+def insert_rows(model, values):
+    """
+    Inserts all rows and returns their new ids, in the order of values. The ids
+    are settled before the executemany rather than read back from it, since
+    nothing guarantees the order of the rows RETURNING yields for an executemany.
+    """
+    if not values:
+        return []
+    table = model.__table__
+    keys = list(dict.fromkeys(key for row in values for key in row))
+    values = [{key: row.get(key) for key in keys} for row in values]
+    dialect = db.session.get_bind().dialect
+
+    if dialect.name == "postgresql":
+        sequence = func.pg_get_serial_sequence(table.name, "id")
+        ids = list(db.session.execute(select(func.nextval(sequence)).select_from(func.generate_series(1, len(values)))).scalars())
+        db.session.execute(insert(table), [dict(row, id=new_id) for row, new_id in zip(values, ids)])
+        return ids
+
+    if dialect.name == "sqlite":
+        # The first insert takes the database write lock, held until commit, and
+        # gets an id above every existing one: the rest of the batch follows it.
+        first_id = db.session.execute(insert(table).values(values[0])).inserted_primary_key[0]
+        ids = list(range(first_id, first_id + len(values)))
+        if len(values) > 1:
+            db.session.execute(insert(table), [dict(row, id=new_id) for row, new_id in zip(values[1:], ids[1:])])
+        return ids
+
+    return [db.session.execute(insert(table).values(row)).inserted_primary_key[0] for row in values]
+
+
+def insert_batch(model, items, required, references=None, unique=()):
+    """
+    Returns (status, results): CREATED with one result per item, or CONFLICT /
+    INVALID with None when the database refused the batch and nothing was written.
+    """
+    rows, results = validate_batch(model, items, required, references, unique)
+    if rows:
+        try:
+            ids = insert_rows(model, [values for _, values in rows])
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent write took a unique value or deleted a referenced row since we looked
+            db.session.rollback()
+            return CONFLICT, None
+        except DataError:
+            db.session.rollback()
+            return INVALID, None
+        for (index, _), new_id in zip(rows, ids):
+            results[index] = {"index": index, "status": "created", "id": new_id}
+    return CREATED, results
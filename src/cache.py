@@ -0,0 +1,96 @@
+"""
+Bounded LRU cache with a TTL for serialized single-entity lookups.
+
+Entries are keyed by (model name, id) and hold the serialize() dict, so a hit
+skips both the query and the ORM hydration. Each worker process has its own
+cache, so every entry also records the table version (versioning.py) it was
+read under, and a lookup only uses it while the caller still sees that version.
+Any write to the table, from another worker or `flask import-dump` as well,
+moves the version and retires the entries of that table. The PUT/DELETE
+handlers also drop the local copy, and the TTL bounds how long an idle entry
+holds memory.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class EntityCache:
+
+    def __init__(self, max_size=1024, ttl=60, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    def get(self, model_name, entity_id, version):
+        """
+        Returns a copy of the dict cached under version, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        key = (model_name, entity_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, entry_version, value = entry
+            if expires_at <= self.clock() or entry_version != version:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(value)
+
+    def set(self, model_name, entity_id, version, value):
+        if not self.enabled:
+            return
+        key = (model_name, entity_id)
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, version, dict(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, model_name, entity_id):
+        with self._lock:
+            self._entries.pop((model_name, entity_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl
+            }
+
+    def metric_lines(self):
+        stats = self.stats()
+        return [
+            "# TYPE entity_cache_hits_total counter",
+            "entity_cache_hits_total %d" % stats["hits"],
+            "# TYPE entity_cache_misses_total counter",
+            "entity_cache_misses_total %d" % stats["misses"],
+            "# TYPE entity_cache_evictions_total counter",
+            "entity_cache_evictions_total %d" % stats["evictions"],
+            "# TYPE entity_cache_entries gauge",
+            "entity_cache_entries %d" % stats["size"],
+        ]
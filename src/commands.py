@@ -0,0 +1,212 @@
+import os
+import re
+import subprocess
+import sys
+import click
+from sqlalchemy import select
+from models import db, User, Character, Planet, Specie, Favorite
+from query_plans import EXPLAIN_DIALECTS, check_hot_queries, hot_queries
+from importer import import_dump, row_builders, References
+from favorites import rebuild_counts
+
+"""
+In this file, you can add as many commands as you want using the @app.cli.command decorator
+Flask commands are usefull to run cronjobs or tasks outside of the API but sill in integration
+with your database.
+"""
+class MigrateGroup(click.Group):
+    """
+    Stands in for the `flask db` group of Flask-Migrate, which imports alembic: the
+    extension is set up when a db command runs instead of on every boot.
+    """
+
+    def __init__(self, app):
+        super().__init__("db", help="Perform database migrations.")
+        self.app = app
+
+    def migrate_group(self):
+        from flask_migrate import Migrate
+        # registers the real group under the same name, replacing this one
+        Migrate(self.app, db)
+        return self.app.cli.commands["db"]
+
+    def list_commands(self, ctx):
+        return self.migrate_group().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self.migrate_group().get_command(ctx, name)
+
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def import_times(module):
+    """
+    Imports module in a fresh interpreter with -X importtime and returns
+    [(name, self_us, cumulative_us, depth)] for module and everything it imported,
+    module last. Imports done by the interpreter at startup are left out.
+    """
+    src = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            cwd=src, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise click.ClickException("import %s failed:\n%s" % (module, result.stderr[-2000:]))
+    times = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match:
+            times.append((match[4], int(match[1]), int(match[2]), len(match[3]) // 2))
+    # children are printed before their parent, so the subtree starts after the previous top-level import
+    end = max(i for i, (name, _, _, depth) in enumerate(times) if name == module and depth == 0)
+    start = max([i + 1 for i, (_, _, _, depth) in enumerate(times[:end]) if depth == 0], default=0)
+    return times[start:end + 1]
+
+
+def setup_commands(app):
+
+    app.cli.add_command(MigrateGroup(app))
+
+
+    """
+    Runs EXPLAIN on every hot query of the API and exits with status 1 if any of them
+    falls back to a sequential scan. Run it after migrating: $ flask check-query-plans
+    """
+    @app.cli.command("check-query-plans")
+    def check_query_plans():
+        dialect = db.session.get_bind().dialect.name
+        if dialect not in EXPLAIN_DIALECTS:
+            raise click.ClickException("check-query-plans supports %s databases, not %s" % (" and ".join(EXPLAIN_DIALECTS), dialect))
+        failures = check_hot_queries()
+        for name in hot_queries():
+            if name in failures:
+                click.echo(f"FAIL {name}: " + "; ".join(failures[name]))
+            else:
+                click.echo(f"ok   {name}")
+
+        if failures:
+            raise SystemExit(1)
+
+
+    """
+    Sends the same read requests to the Flask app and to the ASGI app in asgi.py and
+    compares status, body and ETag. Read-only, uses whatever rows the database holds:
+    $ flask check-asgi-parity
+    """
+    @app.cli.command("check-asgi-parity")
+    def check_asgi_parity():
+        from starlette.testclient import TestClient
+        from asgi import application
+
+        paths = ["/users", "/characters", "/planets", "/species", "/favorites",
+                 "/characters?limit=1", "/planets?fields=name", "/users?limit=0", "/species?after=!",
+                 "/user/0", "/character/0", "/planet/0", "/specie/0", "/user/0/favorites",
+                 "/characters?planet_id=1&fields=name", "/characters?specie_id=1&limit=2", "/species?planet_id=1",
+                 "/planets?id__in=1,2,3", "/users?id__in=x", "/favorites?user_id=1&character_id=1"]
+        for model, path in [(User, "/user/%d"), (Character, "/character/%d"), (Planet, "/planet/%d"), (Specie, "/specie/%d")]:
+            first = db.session.execute(select(model.id).order_by(model.id).limit(1)).scalar()
+            if first is not None:
+                paths += [path % first, path % first + "?fields=name"]
+        user_id = db.session.execute(select(Favorite.user_id).limit(1)).scalar()
+        if user_id is not None:
+            paths += ["/user/%d/favorites" % user_id, "/user/%d/favorites?limit=1&fields=planet_id" % user_id]
+        db.session.remove()
+
+        flask_client = app.test_client()
+        failures = 0
+        with TestClient(application) as asgi_client:
+            for path in paths:
+                # httpx asks for compressed bodies unless told otherwise, the Flask test client does not
+                headers = {"Accept": "application/json", "Accept-Encoding": "identity"}
+                expected = flask_client.get(path, headers=headers)
+                got = asgi_client.get(path, headers=headers)
+                conditional = asgi_client.get(path, headers=dict(headers, **{"If-None-Match": got.headers.get("ETag", "")}))
+                same = (expected.status_code == got.status_code and expected.data == got.content
+                        and expected.headers.get("ETag") == got.headers.get("ETag")
+                        and (got.status_code != 200 or conditional.status_code == 304))
+                click.echo(("ok   " if same else "FAIL ") + path)
+                if not same:
+                    failures += 1
+                    click.echo("  flask: %s %s %r" % (expected.status_code, expected.headers.get("ETag"), expected.data[:200]))
+                    click.echo("  asgi:  %s %s %r" % (got.status_code, got.headers.get("ETag"), got.content[:200]))
+
+        if failures:
+            raise SystemExit(1)
+
+
+    """
+    Streams SWAPI-style JSON / CSV dumps into the database in large batches (COPY on
+    PostgreSQL, executemany otherwise). Several dumps can go in one run, in the order
+    given, so species and characters can point at the planets loaded before them:
+    $ flask import-dump planets.json species.json people.json --drop-indexes
+    The kind of each dump comes from its file name unless --kind is given.
+    Other writers wait while a dump loads (table lock on PostgreSQL, database write
+    lock on SQLite); on other databases, run it while nothing else writes.
+    """
+    @app.cli.command("import-dump")
+    @click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+    @click.option("--kind", type=click.Choice(sorted(row_builders)), help="What every dump holds.")
+    @click.option("--format", "fmt", type=click.Choice(["auto", "json", "csv"]), default="auto", show_default=True)
+    @click.option("--batch-size", type=click.IntRange(1), default=5000, show_default=True)
+    @click.option("--drop-indexes", is_flag=True, help="Drop non-unique indexes during the load and rebuild them after.")
+    @click.option("--no-copy", is_flag=True, help="Use executemany even on PostgreSQL.")
+    def import_dump_command(paths, kind, fmt, batch_size, drop_indexes, no_copy):
+        refs = References()
+        for path in paths:
+            name = path.replace("\\", "/").rsplit("/", 1)[-1].lower()
+            path_kind = kind or next((choice for choice in row_builders if name.startswith(choice)), None)
+            if path_kind is None:
+                raise click.UsageError("Cannot tell what %s holds, use --kind" % path)
+            path_fmt = fmt if fmt != "auto" else ("csv" if name.endswith(".csv") else "json")
+
+            def progress(loaded, rejected, elapsed):
+                click.echo("  %s: %d rows, %d rejected, %.0f rows/s" % (path_kind, loaded, rejected, loaded / elapsed if elapsed else 0))
+
+            click.echo("Importing %s as %s (%s)" % (path, path_kind, path_fmt))
+            try:
+                with open(path, newline="", encoding="utf-8") as stream:
+                    summary = import_dump(path_kind, stream, path_fmt, batch_size, drop_indexes=drop_indexes,
+                                          use_copy=not no_copy, progress=progress, refs=refs)
+            except Exception:
+                db.session.rollback()
+                raise
+            for error in summary["errors"]:
+                click.echo("  rejected " + error)
+            click.echo("  %s: %d rows loaded%s, %d rejected in %ss" % (
+                summary["table"], summary["loaded"], " with COPY" if summary["copy"] else "", summary["rejected"], summary["seconds"]))
+
+
+    """
+    Recomputes the favorite_count table behind GET /favorites/top from the favorite
+    table, after loads or edits that bypassed the API: $ flask rebuild-favorite-counts
+    """
+    @app.cli.command("rebuild-favorite-counts")
+    def rebuild_favorite_counts():
+        for target_type, targets in rebuild_counts().items():
+            click.echo("%s: %d targets" % (target_type, targets))
+
+
+    """
+    Measures what importing the app costs a fresh worker, in a new interpreter
+    with -X importtime, and lists the top-level packages by the time spent in
+    their own modules. Exits with status 1 above --budget-ms, to catch imports
+    that make boot slower: $ flask profile-imports --budget-ms 800
+    """
+    @app.cli.command("profile-imports")
+    @click.option("--module", default="wsgi", show_default=True, help="Module to import, from src/.")
+    @click.option("--limit", type=click.IntRange(1), default=20, show_default=True, help="Packages to list.")
+    @click.option("--budget-ms", type=float, help="Fail when the whole import takes longer.")
+    def profile_imports(module, limit, budget_ms):
+        times = import_times(module)
+        packages = {}
+        for name, self_us, _, _ in times:
+            package = name.split(".", 1)[0]
+            packages[package] = packages.get(package, 0) + self_us
+        total_us = times[-1][2]
+
+        click.echo("import %s: %.1f ms, %d modules" % (module, total_us / 1000, len(times)))
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:limit]:
+            click.echo("%9.1f ms %5.1f%%  %s" % (self_us / 1000, 100.0 * self_us / total_us, package))
+
+        if budget_ms is not None and total_us / 1000 > budget_ms:
+            click.echo("FAIL over the %.0f ms budget" % budget_ms)
+            raise SystemExit(1)
@@ -0,0 +1,249 @@
+"""
+Negotiated response compression (zstd, br, gzip), registered with setup_compression(app).
+
+An after_request hook picks the first algorithm of COMPRESS_ALGORITHMS that the
+client accepts and that is installed (gzip always is; brotli and zstandard are
+optional packages), and compresses text responses of at least
+COMPRESS_MIN_SIZE bytes. Responses that carry an ETag are compressed once per
+(ETag, encoding) and served from an LRU of compressed bodies afterwards; their
+ETag becomes weak, since the bytes now depend on the encoding, and @conditional
+matches If-None-Match weakly. Streamed responses (NDJSON exports) are wrapped
+in an incremental compressor, so the body is never buffered as a whole: output
+is emitted as the compressor produces it and flushed every
+COMPRESS_STREAM_FLUSH_SIZE bytes of input. Their ETag becomes weak as well.
+The async views of asgi.py share the negotiation, the LRU and the counters.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+MIMETYPES = {"application/json", "application/x-ndjson", "application/javascript",
+             "text/plain", "text/html", "text/css", "text/csv"}
+
+
+class GzipEncoder:
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.finish()
+
+    def compressor(self):
+        stream = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return StreamCompressor(stream.compress, lambda: stream.flush(zlib.Z_SYNC_FLUSH), stream.flush)
+
+
+class BrotliEncoder:
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def compressor(self):
+        stream = brotli.Compressor(quality=self.level)
+        return StreamCompressor(stream.process, stream.flush, stream.finish)
+
+
+class ZstdEncoder:
+
+    def __init__(self, level):
+        self.compressor_factory = zstandard.ZstdCompressor(level=level)
+
+    def compress(self, data):
+        return self.compressor_factory.compress(data)
+
+    def compressor(self):
+        stream = self.compressor_factory.compressobj()
+        return StreamCompressor(stream.compress, lambda: stream.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), stream.flush)
+
+
+class StreamCompressor:
+    """
+    Same three calls for every algorithm: compress a chunk, flush what is buffered, finish the stream.
+    """
+
+    def __init__(self, compress, flush, finish):
+        self.compress = compress
+        self.flush = flush
+        self.finish = finish
+
+
+def available_encoders(config):
+    encoders = {"gzip": GzipEncoder(config['COMPRESS_GZIP_LEVEL'])}
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder(config['COMPRESS_BROTLI_LEVEL'])
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder(config['COMPRESS_ZSTD_LEVEL'])
+    return encoders
+
+
+class CompressedCache:
+    """
+    LRU of compressed bodies keyed by (etag, encoding).
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class Compression:
+
+    def __init__(self, config):
+        self.encoders = available_encoders(config)
+        self.preference = [name.strip() for name in config['COMPRESS_ALGORITHMS'].split(",")
+                           if name.strip() in self.encoders]
+        self.min_size = config['COMPRESS_MIN_SIZE']
+        self.flush_size = config['COMPRESS_STREAM_FLUSH_SIZE']
+        self.cache = CompressedCache(config['COMPRESS_CACHE_SIZE'])
+        self.bytes_in = dict.fromkeys(self.encoders, 0)
+        self.bytes_out = dict.fromkeys(self.encoders, 0)
+        self._lock = threading.Lock()
+
+    def negotiate(self, accepted):
+        for name in self.preference:
+            if accepted[name] > 0:
+                return name
+        return None
+
+    def count(self, encoding, bytes_in, bytes_out):
+        with self._lock:
+            self.bytes_in[encoding] += bytes_in
+            self.bytes_out[encoding] += bytes_out
+
+    def compressible(self, response):
+        return (response.mimetype in MIMETYPES
+                and 200 <= response.status_code < 300 and response.status_code not in (204, 206)
+                and not response.direct_passthrough
+                and "Content-Encoding" not in response.headers
+                and "no-transform" not in response.headers.get("Cache-Control", ""))
+
+    def __call__(self, response):
+        if not self.preference or not self.compressible(response):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = self.negotiate(request.accept_encodings)
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            return self.compress_stream(response, encoding)
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        etag, weak = response.get_etag()
+        response.set_data(self.encode(data, encoding, etag))
+        response.headers["Content-Encoding"] = encoding
+        weaken_etag(response)
+        return response
+
+    def encode(self, data, encoding, etag=None):
+        body = self.cache.get((etag, encoding)) if etag else None
+        if body is None:
+            body = self.encoders[encoding].compress(data)
+            if etag:
+                self.cache.set((etag, encoding), body)
+        self.count(encoding, len(data), len(body))
+        return body
+
+    def compress_stream(self, response, encoding):
+        chunks = response.response
+        compressor = self.encoders[encoding].compressor()
+
+        def generate():
+            pending = 0
+            bytes_in = bytes_out = 0
+            try:
+                for chunk in chunks:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    bytes_in += len(chunk)
+                    pending += len(chunk)
+                    out = compressor.compress(chunk)
+                    if pending >= self.flush_size:
+                        # Bounds how long a slow stream keeps rows in the compressor's buffer
+                        out += compressor.flush()
+                        pending = 0
+                    if out:
+                        bytes_out += len(out)
+                        yield out
+                out = compressor.finish()
+                bytes_out += len(out)
+                yield out
+            finally:
+                close = getattr(chunks, "close", None)
+                if close is not None:
+                    close()
+                self.count(encoding, bytes_in, bytes_out)
+
+        response.response = generate()
+        response.headers.pop("Content-Length", None)
+        response.headers["Content-Encoding"] = encoding
+        weaken_etag(response)
+        return response
+
+    def metric_lines(self):
+        with self._lock:
+            lines = ["# TYPE http_compression_input_bytes_total counter"]
+            lines += ['http_compression_input_bytes_total{encoding="%s"} %d' % item for item in sorted(self.bytes_in.items())]
+            lines.append("# TYPE http_compression_output_bytes_total counter")
+            lines += ['http_compression_output_bytes_total{encoding="%s"} %d' % item for item in sorted(self.bytes_out.items())]
+        lines += [
+            "# TYPE http_compression_cache_hits_total counter",
+            "http_compression_cache_hits_total %d" % self.cache.hits,
+            "# TYPE http_compression_cache_misses_total counter",
+            "http_compression_cache_misses_total %d" % self.cache.misses,
+        ]
+        return lines
+
+
+def weaken_etag(response):
+    # The encoded bytes differ from the identity body the strong ETag was made for
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def setup_compression(app):
+    compression = Compression(app.config)
+    app.after_request(compression)
+    return compression
@@ -0,0 +1,80 @@
+"""
+Database configuration, read from the environment.
+
+    DATABASE_URL              postgres://... (falls back to sqlite:////tmp/test.db)
+    DB_POOL_SIZE              connections kept open per worker (default 5)
+    DB_MAX_OVERFLOW           extra connections allowed under load (default 10)
+    DB_POOL_TIMEOUT           seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE           reconnect connections older than this, in seconds (default 1800)
+    DB_POOL_PRE_PING          test connections before use, drops stale ones (default true)
+    DB_SQLITE_WAL             journal_mode=WAL so readers do not block on the writer (default true)
+    DB_SQLITE_SYNCHRONOUS     synchronous pragma, NORMAL is safe with WAL (default NORMAL)
+    DB_SQLITE_BUSY_TIMEOUT    milliseconds a writer waits for the lock instead of failing (default 5000)
+    DB_SQLITE_MMAP_SIZE       bytes of the file mapped into memory for reads (default 268435456)
+"""
+import os
+from sqlalchemy import event
+
+
+def env_bool(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def database_url():
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        return db_url.replace("postgres://", "postgresql://")
+    return "sqlite:////tmp/test.db"
+
+
+def engine_options(url):
+    options = {
+        "pool_pre_ping": env_bool("DB_POOL_PRE_PING", True),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    }
+    # SQLite gets its own pool classes from SQLAlchemy, which take no size settings
+    if not url.startswith("sqlite"):
+        options["pool_size"] = int(os.getenv("DB_POOL_SIZE", 5))
+        options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", 10))
+        options["pool_timeout"] = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    return options
+
+
+def sqlite_pragmas():
+    pragmas = [
+        # Favorites rely on foreign keys to reject unknown ids, SQLite ignores them unless asked
+        "PRAGMA foreign_keys=ON",
+        "PRAGMA busy_timeout=%d" % int(os.getenv("DB_SQLITE_BUSY_TIMEOUT", 5000)),
+        "PRAGMA mmap_size=%d" % int(os.getenv("DB_SQLITE_MMAP_SIZE", 268435456)),
+        "PRAGMA synchronous=%s" % os.getenv("DB_SQLITE_SYNCHRONOUS", "NORMAL").upper(),
+    ]
+    if env_bool("DB_SQLITE_WAL", True):
+        pragmas.insert(0, "PRAGMA journal_mode=WAL")
+    return pragmas
+
+
+def sqlite_pragma_listener():
+    pragmas = sqlite_pragmas()
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return set_sqlite_pragmas
+
+
+def configure_database(app, db):
+    url = database_url()
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url)
+    db.init_app(app)
+
+    if url.startswith("sqlite"):
+        with app.app_context():
+            event.listen(db.engine, "connect", sqlite_pragma_listener())
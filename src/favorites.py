@@ -0,0 +1,274 @@
+"""
+Write path for favorites. Adding a favorite is a single
+INSERT ... ON CONFLICT DO NOTHING against the partial unique indexes on
+Favorite, and the foreign keys stand in for the user/target lookups.
+
+POST /user/<user_id>/favorites/batch goes through apply_batch: one set-based
+query per type validates the targets, the inserts and deletes run as bulk
+statements, and everything commits together.
+
+Every add and remove also moves the target's FavoriteCount in the same
+transaction, which is what GET /favorites/top reads. Writes that bypass this
+module (Flask-Admin, raw SQL, the benchmark dataset) leave the counters stale
+until `flask rebuild-favorite-counts`.
+"""
+from sqlalchemy import bindparam, delete, func, insert, literal, select, text, update
+from sqlalchemy.exc import IntegrityError
+from bulk import UPSERT_INSERTS, existing_values, insert_rows
+from models import db, User, Character, Planet, Specie, Favorite, FavoriteCount
+
+CREATED = "created"
+EXISTS = "exists"
+USER_NOT_FOUND = "user_not_found"
+TARGET_NOT_FOUND = "target_not_found"
+CONFLICT = "conflict"
+APPLIED = "applied"
+
+# ?type= of /favorites/top -> (Favorite column, target model)
+TARGETS = {
+    "character": ("character_id", Character),
+    "planet": ("planet_id", Planet),
+    "specie": ("specie_id", Specie),
+}
+TARGET_TYPES = {column: name for name, (column, _) in TARGETS.items()}
+
+def _upsert(values, column):
+    dialect = db.session.get_bind().dialect
+    stmt = UPSERT_INSERTS[dialect.name](Favorite).values(**values).on_conflict_do_nothing(
+        index_elements=[Favorite.user_id, getattr(Favorite, column)],
+        index_where=getattr(Favorite, column).isnot(None),
+    )
+    if dialect.name == "postgresql" or getattr(dialect, "insert_returning", False):
+        return db.session.execute(stmt.returning(Favorite.id)).scalar()
+    result = db.session.execute(stmt)
+    return result.inserted_primary_key[0] if result.rowcount else None
+
+
+def _insert_if_missing(values, column):
+    # Dialects without ON CONFLICT: look first, then insert
+    existing = db.session.execute(
+        select(Favorite.id).filter_by(**values).where(getattr(Favorite, column).isnot(None))
+    ).first()
+    if existing:
+        return None
+    return db.session.execute(insert(Favorite).values(**values)).inserted_primary_key[0]
+
+
+def count_favorite(column, target_id, delta):
+    """
+    Moves the counter of one target by delta, inside the caller's transaction.
+    """
+    target_type = TARGET_TYPES[column]
+    name = db.session.get_bind().dialect.name
+    if delta > 0 and name in UPSERT_INSERTS:
+        stmt = UPSERT_INSERTS[name](FavoriteCount).values(target_type=target_type, target_id=target_id, count=delta)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[FavoriteCount.target_type, FavoriteCount.target_id],
+            set_={"count": FavoriteCount.count + stmt.excluded["count"]},
+        ))
+        return
+    result = db.session.execute(
+        update(FavoriteCount)
+        .where(FavoriteCount.target_type == target_type, FavoriteCount.target_id == target_id, FavoriteCount.count + delta >= 0)
+        .values(count=FavoriteCount.count + delta)
+    )
+    if not result.rowcount and delta > 0:
+        db.session.execute(insert(FavoriteCount).values(target_type=target_type, target_id=target_id, count=delta))
+
+
+def count_favorites(deltas):
+    """
+    count_favorite for many targets at once: {(column, target_id): delta}, one executemany per direction.
+    """
+    name = db.session.get_bind().dialect.name
+    increments = [{"target_type": TARGET_TYPES[column], "target_id": target_id, "count": delta}
+                  for (column, target_id), delta in deltas.items() if delta > 0]
+    decrements = [{"type": TARGET_TYPES[column], "id": target_id, "delta": -delta}
+                  for (column, target_id), delta in deltas.items() if delta < 0]
+    if name not in UPSERT_INSERTS:
+        for (column, target_id), delta in deltas.items():
+            if delta:
+                count_favorite(column, target_id, delta)
+        return
+
+    table = FavoriteCount.__table__
+    if increments:
+        stmt = UPSERT_INSERTS[name](table)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.target_type, table.c.target_id],
+            set_={"count": table.c.count + stmt.excluded["count"]},
+        ), increments)
+    if decrements:
+        db.session.execute(
+            update(table)
+            .where(table.c.target_type == bindparam("type"), table.c.target_id == bindparam("id"),
+                   table.c.count >= bindparam("delta"))
+            .values(count=table.c.count - bindparam("delta")),
+            decrements,
+        )
+
+
+def add_favorite(user_id, column, target_id):
+    """
+    Returns (status, favorite) where favorite is the serialized row when it was created.
+    """
+    values = {"user_id": user_id, column: target_id}
+    try:
+        if db.session.get_bind().dialect.name in UPSERT_INSERTS:
+            favorite_id = _upsert(values, column)
+        else:
+            favorite_id = _insert_if_missing(values, column)
+        if favorite_id is not None:
+            count_favorite(column, target_id, 1)
+        db.session.commit()
+    except IntegrityError:
+        # Only a foreign key can fail here; one lookup on the error path tells which
+        db.session.rollback()
+        if db.session.get(User, user_id) is None:
+            return USER_NOT_FOUND, None
+        return TARGET_NOT_FOUND, None
+
+    if favorite_id is None:
+        return EXISTS, None
+    favorite = {"id": favorite_id, "user_id": user_id, "planet_id": None, "specie_id": None, "character_id": None}
+    favorite[column] = target_id
+    return CREATED, favorite
+
+
+def remove_favorite(favorite):
+    """
+    Deletes the favorite and decrements its target's counter; the caller commits.
+    """
+    for column in TARGET_TYPES:
+        if getattr(favorite, column) is not None:
+            count_favorite(column, getattr(favorite, column), -1)
+    db.session.delete(favorite)
+
+
+def top_favorites(target_type, limit):
+    """
+    The `limit` most favorited rows of one type, each with a "favorites" count.
+    Walks ix_favorite_count_top from the top and joins the targets by primary key.
+    """
+    column, model = TARGETS[target_type]
+    stmt = (
+        select(*model.__table__.columns, FavoriteCount.count.label("favorites"))
+        .join(model, model.id == FavoriteCount.target_id)
+        .where(FavoriteCount.target_type == target_type, FavoriteCount.count > 0)
+        .order_by(FavoriteCount.count.desc(), FavoriteCount.target_id)
+        .limit(limit)
+    )
+    return [row._asdict() for row in db.session.execute(stmt)]
+
+
+def rebuild_counts():
+    """
+    Recomputes every counter from the favorite table in one transaction and returns {type: targets counted}.
+    """
+    if db.session.get_bind().dialect.name == "postgresql":
+        # Holds off favorite writes so no add/remove lands between the count and the commit
+        db.session.execute(text("LOCK TABLE favorite IN SHARE MODE"))
+    db.session.execute(delete(FavoriteCount))
+    counted = {}
+    for target_type, (column, _) in TARGETS.items():
+        target = getattr(Favorite, column)
+        counts = (select(literal(target_type), target, func.count())
+                  .where(target.isnot(None))
+                  .group_by(target))
+        result = db.session.execute(insert(FavoriteCount).from_select(["target_type", "target_id", "count"], counts))
+        counted[target_type] = result.rowcount
+    db.session.commit()
+    return counted
+
+
+def parse_operation(operation):
+    """
+    Returns (op, column, target_id) or raises ValueError with the message for the client.
+    """
+    if not isinstance(operation, dict):
+        raise ValueError("Operation must be an object")
+    op = operation.get("op")
+    if op not in ("add", "delete"):
+        raise ValueError("op must be add or delete")
+    if operation.get("type") not in TARGETS:
+        raise ValueError("type must be one of: " + ", ".join(TARGETS))
+    target_id = operation.get("id")
+    if not isinstance(target_id, int) or isinstance(target_id, bool) or target_id < 1:
+        raise ValueError("id must be a positive integer")
+    return op, TARGETS[operation["type"]][0], target_id
+
+
+def apply_batch(user_id, operations):
+    """
+    Applies [{op, type, id}] to one user's favorites in order, in one transaction.
+    Returns (status, results) with one result per operation; operations that
+    fail validation are reported and skipped, the rest are applied.
+    """
+    if db.session.get(User, user_id) is None:
+        return USER_NOT_FOUND, None
+
+    results = [None] * len(operations)
+    parsed = []
+    for index, operation in enumerate(operations):
+        try:
+            parsed.append((index,) + parse_operation(operation))
+        except ValueError as error:
+            results[index] = {"index": index, "status": "error", "error": str(error)}
+
+    # One query per type for the targets that exist and one for the user's current favorites of them
+    found = {}
+    current = {}
+    for target_type, (column, model) in TARGETS.items():
+        ids = set(target_id for _, _, op_column, target_id in parsed if op_column == column)
+        found[column] = existing_values(model.id, ids)
+        current[column] = {}
+        if ids:
+            target = getattr(Favorite, column)
+            rows = db.session.execute(select(Favorite.id, target).where(Favorite.user_id == user_id, target.in_(ids)))
+            current[column] = {row[1]: row.id for row in rows}
+
+    # Replays the operations on the in-memory state so that a batch may add and delete the same target
+    pending = {}
+    deleted = []
+    deltas = {}
+    for index, op, column, target_id in parsed:
+        if target_id not in found[column]:
+            results[index] = {"index": index, "status": "error", "error": "Not found: " + TARGET_TYPES[column]}
+            continue
+        key = (column, target_id)
+        if op == "add":
+            if target_id in current[column] or key in pending:
+                results[index] = {"index": index, "status": "exists"}
+                continue
+            pending[key] = index
+            deltas[key] = deltas.get(key, 0) + 1
+            results[index] = {"index": index, "status": "created"}
+        else:
+            if key in pending:
+                results[pending.pop(key)]["status"] = "cancelled"
+            elif target_id in current[column]:
+                deleted.append(current[column].pop(target_id))
+            else:
+                results[index] = {"index": index, "status": "error", "error": "Favorite not found"}
+                continue
+            deltas[key] = deltas.get(key, 0) - 1
+            results[index] = {"index": index, "status": "deleted"}
+
+    try:
+        if deleted:
+            db.session.execute(delete(Favorite.__table__).where(Favorite.__table__.c.id.in_(deleted)))
+        if pending:
+            values = []
+            for column, target_id in pending:
+                row = {"user_id": user_id, "character_id": None, "planet_id": None, "specie_id": None}
+                row[column] = target_id
+                values.append(row)
+            for index, favorite_id in zip(pending.values(), insert_rows(Favorite, values)):
+                results[index]["id"] = favorite_id
+        count_favorites(deltas)
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request added one of these favorites, or deleted a target, since we looked
+        db.session.rollback()
+        return CONFLICT, None
+    return APPLIED, results
@@ -0,0 +1,84 @@
+"""
+Gunicorn settings, read from the environment. Used by the Procfile and render.yaml:
+
+    $ gunicorn -c src/gunicorn_config.py wsgi --chdir ./src/
+
+    GUNICORN_WORKER_CLASS   sync, gthread or uvicorn (asgi:application) (default gthread)
+    WEB_CONCURRENCY         worker processes (default 2 x CPUs + 1 for sync, CPUs + 1 otherwise,
+                            at most MAX_DEFAULT_WORKERS)
+    GUNICORN_THREADS        threads per gthread worker (default 4)
+    GUNICORN_PRELOAD        import the app once in the master and fork it (default true)
+    GUNICORN_TIMEOUT        seconds before a silent worker is killed and restarted (default 30)
+    GUNICORN_KEEPALIVE      seconds an idle keep-alive connection is held (default 5)
+    GUNICORN_MAX_REQUESTS   recycle a worker after this many requests, 0 never (default 0)
+
+CPUs are the ones this process may run on and, in a container, its CPU quota,
+not the host's. Every worker holds its own DB_POOL_SIZE + DB_MAX_OVERFLOW
+connections and its own copy of the app, so set WEB_CONCURRENCY explicitly on
+small instances and keep workers x pool within the database's max_connections.
+
+With gthread, keep DB_POOL_SIZE + DB_MAX_OVERFLOW at or above GUNICORN_THREADS,
+or requests wait on the pool instead of the database.
+"""
+import math
+import os
+import sys
+
+# Gunicorn reads this file before --chdir puts src/ on the path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from config import env_bool
+
+MAX_DEFAULT_WORKERS = 8
+
+
+def available_cpus():
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    # cgroup v2 quota, "max 100000" when unlimited
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as stream:
+            quota, period = stream.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+CPUS = available_cpus()
+WORKER_CLASSES = {
+    "sync": "sync",
+    "gthread": "gthread",
+    # for asgi:application instead of wsgi
+    "uvicorn": "uvicorn.workers.UvicornWorker",
+}
+
+worker = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+if worker not in WORKER_CLASSES:
+    raise RuntimeError("GUNICORN_WORKER_CLASS must be one of %s, not %r" % (", ".join(WORKER_CLASSES), worker))
+worker_class = WORKER_CLASSES[worker]
+
+workers = int(os.getenv("WEB_CONCURRENCY", 0)) or min(CPUS * 2 + 1 if worker == "sync" else CPUS + 1, MAX_DEFAULT_WORKERS)
+threads = int(os.getenv("GUNICORN_THREADS", 4)) if worker == "gthread" else 1
+preload_app = env_bool("GUNICORN_PRELOAD", True)
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = timeout
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:" + os.getenv("PORT", "3000"))
+accesslog = "-" if env_bool("GUNICORN_ACCESS_LOG", False) else None
+
+
+def post_fork(server, worker):
+    """
+    With preload_app the pool was created in the master, and anything that ran a
+    query there left connections in it. Sockets must not be shared between
+    processes, so each worker forgets the inherited ones without closing them
+    (the master still owns them) and opens its own on first use.
+    """
+    if not preload_app:
+        return
+    from app import app
+    from models import db
+    with app.app_context():
+        db.engine.dispose(close=False)
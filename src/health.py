@@ -0,0 +1,64 @@
+"""
+Liveness and readiness probes, registered with init_health(app).
+
+GET /healthz answers 200 whenever the worker can run a view and never touches
+the database: a slow or unreachable database should not get workers restarted.
+
+GET /readyz answers 200 when the database answered SELECT 1 and 503 otherwise.
+The outcome is kept for READY_CHECK_INTERVAL seconds per worker, so frequent
+probes reach the database at most once per interval, and a probe that arrives
+while another thread is checking gets the previous outcome instead of waiting.
+"""
+import threading
+import time
+from flask import jsonify
+from sqlalchemy import text
+from models import db
+
+
+class ReadinessCheck:
+
+    def __init__(self, interval, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.checked_at = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def run(self):
+        try:
+            with db.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+            self.error = None
+        except Exception as e:
+            self.error = str(e)
+        self.checked_at = self.clock()
+
+    def __call__(self):
+        """
+        Returns None when ready, otherwise the error of the last check.
+        """
+        stale = self.checked_at is None or self.clock() - self.checked_at >= self.interval
+        if stale and self._lock.acquire(blocking=self.checked_at is None):
+            try:
+                self.run()
+            finally:
+                self._lock.release()
+        return self.error
+
+
+def init_health(app):
+    check = ReadinessCheck(app.config['READY_CHECK_INTERVAL'])
+
+    @app.route("/healthz", methods=["GET"])
+    def get_healthz():
+        return jsonify({"status": "ok"}), 200
+
+    @app.route("/readyz", methods=["GET"])
+    def get_readyz():
+        error = check()
+        if error is not None:
+            return jsonify({"status": "unavailable", "error": error}), 503
+        return jsonify({"status": "ok"}), 200
+
+    return check
@@ -0,0 +1,371 @@
+"""
+Bulk loader behind `flask import-dump`, for seeding the catalogue from large
+SWAPI-style dumps without going through the REST routes.
+
+Dumps are read as a stream: CSV with a header row, a JSON array, JSON lines, or
+SWAPI pages ({"results": [...]}). Each record is mapped to a row (see
+row_builders) and its planet/species references are resolved in memory against
+the ids already in the database and the records loaded earlier in the same run:
+
+    planet_id / specie_id   an existing id
+    homeworld / species     a SWAPI url or "id" of a record loaded earlier in the run,
+                            or the name of an existing row
+
+Ids are handed out by the loader (max(id) + 1 onwards) so the rows can go in
+with COPY, which returns nothing. Other writers are kept out until the dump
+commits: by a table lock on PostgreSQL and by the database write lock (BEGIN
+IMMEDIATE) on SQLite. Other databases need the import to be the only writer.
+Batches are written with COPY ... FROM STDIN on PostgreSQL and with executemany
+elsewhere.
+"""
+import csv
+import io
+import json
+import re
+import time
+from sqlalchemy import func, insert, select, text
+from models import db, User, Character, Planet, Specie
+from versioning import bump_versions
+
+READ_SIZE = 1 << 16
+
+# Where json_records is: between top-level values, inside a page's "results" array, or after it
+TOP, IN_RESULTS, AFTER_RESULTS = range(3)
+# What separates the values in each of them
+SEPARATORS = {
+    TOP: re.compile(r"[\s,\[\]]*"),
+    IN_RESULTS: re.compile(r"[\s,]*"),
+    AFTER_RESULTS: re.compile(r"\s*"),
+}
+_STRING = r'"(?:[^"\\]|\\.)*"'
+_SCALAR = r'(?:null|true|false|-?[0-9][0-9.eE+-]*|%s)' % _STRING
+# {"count": 82, "next": "...", "previous": null, "results": [   (scalar members before "results")
+PAGE_HEADER = re.compile(r'\{\s*(?:%s\s*:\s*%s\s*,\s*)*"results"\s*:\s*\[' % (_STRING, _SCALAR))
+# , "key":   (a member after "results", its value is decoded and dropped)
+PAGE_MEMBER = re.compile(r',\s*%s\s*:\s*' % _STRING)
+# Characters to have in the buffer before deciding whether an object opens a page
+PAGE_LOOKAHEAD = 4096
+
+
+class RejectedRecord(Exception):
+    pass
+
+
+def json_records(stream):
+    """
+    Yields the objects of a JSON array, of JSON lines or of SWAPI result pages
+    without holding the whole file in memory. When the file starts with a page,
+    the records inside each page's "results" array are decoded one at a time as
+    well, so a dump made of a single page streams like any other. The buffer is
+    walked with an offset and only compacted when the next chunk is appended.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+    pages = None
+    state = TOP
+
+    def read_more():
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        chunk = stream.read(READ_SIZE)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return not eof
+
+    while True:
+        pos = SEPARATORS[state].match(buffer, pos).end()
+        if pos == len(buffer):
+            if read_more():
+                continue
+            if state != TOP:
+                raise ValueError("Unterminated results page")
+            return
+
+        if state == IN_RESULTS and buffer[pos] == "]":
+            pos += 1
+            state = AFTER_RESULTS
+            continue
+        if state == AFTER_RESULTS:
+            # The members of the page after "results", skipped
+            if buffer[pos] == "}":
+                pos += 1
+                state = TOP
+                continue
+            member = PAGE_MEMBER.match(buffer, pos)
+            try:
+                if member is None:
+                    raise ValueError("Expecting a member of the results page at offset %d" % pos)
+                _, pos = decoder.raw_decode(buffer, member.end())
+            except ValueError:
+                if read_more():
+                    continue
+                raise
+            continue
+
+        if state == TOP and buffer[pos] == "{" and pages is not False:
+            if len(buffer) - pos < PAGE_LOOKAHEAD and read_more():
+                continue
+            header = PAGE_HEADER.match(buffer, pos)
+            # The first object tells whether the file is made of pages
+            if pages is None:
+                pages = header is not None
+            if header is not None:
+                pos = header.end()
+                state = IN_RESULTS
+                continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if read_more():
+                continue
+            raise
+        pos = end
+        if state == TOP and isinstance(value, dict) and isinstance(value.get("results"), list):
+            # A page whose "results" comes after non-scalar members, decoded whole
+            yield from value["results"]
+        else:
+            yield value
+
+
+def csv_records(stream):
+    for record in csv.DictReader(stream):
+        yield {key: value for key, value in record.items() if value not in ("", None)}
+
+
+def read_records(stream, fmt):
+    return csv_records(stream) if fmt == "csv" else json_records(stream)
+
+
+def external_key(record):
+    key = record.get("url") or record.get("id")
+    return str(key).rstrip("/") if key is not None else None
+
+
+class References:
+    """
+    In-memory lookup of existing ids, names and the external keys seen in this run, per model.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = {}
+        self.keys = {}
+        self.emails = None
+
+    def load(self, model):
+        self.ids[model] = set()
+        self.names[model] = {}
+        self.keys.setdefault(model, {})
+        for row in db.session.execute(select(model.id, model.name).order_by(model.id)):
+            self.ids[model].add(row.id)
+            self.names[model].setdefault(row.name, row.id)
+        if model is User:
+            self.emails = set(db.session.execute(select(User.email)).scalars())
+
+    def add(self, model, record, new_id, name):
+        self.ids[model].add(new_id)
+        self.names[model].setdefault(name, new_id)
+        key = external_key(record)
+        if key is not None:
+            self.keys[model][key] = new_id
+
+    def resolve(self, model, record, id_field, ref_field):
+        value = record.get(id_field)
+        if value is not None:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise RejectedRecord("%s is not an id: %r" % (id_field, value))
+            if value not in self.ids[model]:
+                raise RejectedRecord("%s %d not found" % (id_field, value))
+            return value
+
+        value = record.get(ref_field)
+        if isinstance(value, list):
+            # SWAPI people list their species, the first one is the one we keep
+            value = value[0] if value else None
+        if value is None:
+            return None
+        value = str(value)
+        found = self.keys[model].get(value.rstrip("/"), self.names[model].get(value))
+        if found is None:
+            raise RejectedRecord("%s %r not found" % (ref_field, value))
+        return found
+
+
+def required(record, *fields):
+    values = []
+    for field in fields:
+        value = record.get(field)
+        if value in (None, ""):
+            raise RejectedRecord("missing " + field)
+        values.append(value)
+    return values
+
+
+def planet_row(record, refs):
+    name = required(record, "name")[0]
+    clima = record.get("clima", record.get("climate"))
+    if clima in (None, ""):
+        raise RejectedRecord("missing clima")
+    return {"name": name, "clima": clima}
+
+
+def specie_row(record, refs):
+    name = required(record, "name")[0]
+    return {"name": name, "planet_id": refs.resolve(Planet, record, "planet_id", "homeworld")}
+
+
+def character_row(record, refs):
+    name = required(record, "name")[0]
+    row = {
+        "name": name,
+        "planet_id": refs.resolve(Planet, record, "planet_id", "homeworld"),
+        "specie_id": refs.resolve(Specie, record, "specie_id", "species"),
+    }
+    missing = [field for field in ("planet_id", "specie_id") if row[field] is None]
+    if missing:
+        raise RejectedRecord("missing " + ", ".join(missing))
+    return row
+
+
+def user_row(record, refs):
+    name, email = required(record, "name", "email")
+    if name in refs.names[User] or email in refs.emails:
+        raise RejectedRecord("user %r already exists" % name)
+    refs.emails.add(email)
+    return {"name": name, "email": email}
+
+
+# kind -> (model, row builder, models whose references are resolved)
+row_builders = {
+    "planets": (Planet, planet_row, ()),
+    "species": (Specie, specie_row, (Planet,)),
+    "characters": (Character, character_row, (Planet, Specie)),
+    "people": (Character, character_row, (Planet, Specie)),
+    "users": (User, user_row, ()),
+}
+
+
+def is_postgresql():
+    return db.session.get_bind().dialect.name == "postgresql"
+
+
+def next_id(model):
+    table = model.__table__
+    # Keeps concurrent writers out until commit while the loader hands out ids itself
+    if is_postgresql():
+        db.session.execute(text("LOCK TABLE %s IN EXCLUSIVE MODE" % db.session.get_bind().dialect.identifier_preparer.format_table(table)))
+    elif db.session.get_bind().dialect.name == "sqlite":
+        connection = db.session.connection()
+        # pysqlite only opens a transaction before the first write, and a write already holds the lock
+        if not connection.connection.dbapi_connection.in_transaction:
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+    return (db.session.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def copy_rows(model, columns, rows):
+    """
+    Sends the batch through COPY FROM STDIN. Returns False when the driver has no COPY support.
+    """
+    cursor = db.session.connection().connection.dbapi_connection.cursor()
+    if not hasattr(cursor, "copy_expert"):
+        cursor.close()
+        return False
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+    preparer = db.session.get_bind().dialect.identifier_preparer
+    statement = "COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (
+        preparer.format_table(model.__table__), ", ".join(preparer.quote(column) for column in columns))
+    try:
+        cursor.copy_expert(statement, buffer)
+    finally:
+        cursor.close()
+    return True
+
+
+def write_batch(model, columns, rows, use_copy):
+    if use_copy and is_postgresql() and copy_rows(model, columns, rows):
+        return True
+    # Core insert on the connection, not the session: the version is bumped once at the end
+    db.session.connection().execute(insert(model.__table__), rows)
+    return False
+
+
+def droppable_indexes(model):
+    # Unique indexes stay, they are what rejects duplicated users
+    return [index for index in model.__table__.indexes if not index.unique]
+
+
+def reset_sequence(model):
+    if is_postgresql():
+        table = model.__tablename__
+        db.session.execute(text("SELECT setval(pg_get_serial_sequence(:table, 'id'), (SELECT max(id) FROM %s))"
+                                % db.session.get_bind().dialect.identifier_preparer.quote(table)), {"table": table})
+
+
+def import_dump(kind, stream, fmt, batch_size, drop_indexes=False, use_copy=True, progress=None, refs=None):
+    """
+    Loads one dump in a single transaction and returns a summary dict.
+    refs carries the resolved keys from one call to the next, so planets, species and
+    characters of the same dump set can be loaded in that order in one run.
+    """
+    model, build_row, referenced = row_builders[kind]
+    refs = refs or References()
+    for target in set(referenced) | {model}:
+        if target not in refs.ids:
+            refs.load(target)
+
+    columns = ["id"] + [column for column in model.__table__.columns.keys() if column != "id"]
+    new_id = next_id(model)
+    dropped = droppable_indexes(model) if drop_indexes else []
+    connection = db.session.connection()
+    for index in dropped:
+        index.drop(bind=connection)
+
+    started = time.perf_counter()
+    summary = {"kind": kind, "table": model.__tablename__, "loaded": 0, "rejected": 0, "errors": [], "copy": False}
+    batch = []
+
+    def flush():
+        summary["copy"] = write_batch(model, columns, batch, use_copy)
+        summary["loaded"] += len(batch)
+        batch.clear()
+        if progress:
+            elapsed = time.perf_counter() - started
+            progress(summary["loaded"], summary["rejected"], elapsed)
+
+    for number, record in enumerate(read_records(stream, fmt), start=1):
+        try:
+            if not isinstance(record, dict):
+                raise RejectedRecord("not an object")
+            row = build_row(record, refs)
+        except RejectedRecord as error:
+            summary["rejected"] += 1
+            if len(summary["errors"]) < 20:
+                summary["errors"].append("record %d: %s" % (number, error))
+            continue
+        row["id"] = new_id
+        refs.add(model, record, new_id, row["name"])
+        new_id += 1
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    for index in dropped:
+        index.create(bind=connection)
+    reset_sequence(model)
+    bump_versions(connection, [model.__tablename__])
+    db.session.commit()
+    summary["seconds"] = round(time.perf_counter() - started, 2)
+    return summary
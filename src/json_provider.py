@@ -0,0 +1,103 @@
+"""
+JSON provider backed by orjson, registered on the app with setup_json(app).
+
+It produces exactly the bytes Flask's default provider produces for compact
+responses: sorted keys, no whitespace, a trailing newline. Whenever orjson
+would differ it hands the call back to the default provider, so switching
+providers never changes a response. The differences are:
+
+* non-ASCII text while ensure_ascii is on, debug pretty printing and legacy
+  JSON_* config overrides;
+* types orjson cannot encode, and the ones it encodes its own way: datetimes
+  and dates (ISO 8601 instead of an HTTP date), dataclasses and subclasses of
+  the built-in types, which orjson is told to pass through;
+* floats written with an exponent (1e16 instead of 1e+16, 0.00001 instead of
+  1e-05) and NaN / Infinity, which orjson writes as null. Floats in between
+  come out the same from both.
+"""
+import math
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+LEGACY_CONFIG = ("JSON_AS_ASCII", "JSON_SORT_KEYS", "JSONIFY_PRETTYPRINT_REGULAR", "JSONIFY_MIMETYPE")
+COMPACT = (",", ":")
+# Everything in between, and 0.0, repr() writes without an exponent and so does orjson
+PLAIN_FLOATS = (1e-4, 1e16)
+
+
+def plain_floats(obj):
+    """
+    False when obj holds a float orjson would not write the way json.dumps does.
+    """
+    kind = type(obj)
+    if kind is dict:
+        values = obj.values()
+    elif kind is list or kind is tuple:
+        values = obj
+    elif kind is float:
+        return not obj or (math.isfinite(obj) and PLAIN_FLOATS[0] <= abs(obj) < PLAIN_FLOATS[1])
+    else:
+        return True
+    for value in values:
+        # Rows are mostly strings, ints and NULLs: skip them without a call
+        kind = type(value)
+        if kind is not str and kind is not int and value is not None and not plain_floats(value):
+            return False
+    return True
+
+
+class OrjsonProvider(DefaultJSONProvider):
+
+    def _fast_dumps(self, obj):
+        """
+        Returns the compact encoding as bytes, or None when the default provider must be used.
+        """
+        if any(self._app.config.get(key) is not None for key in LEGACY_CONFIG) or not plain_floats(obj):
+            return None
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_SUBCLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            body = orjson.dumps(obj, option=option)
+        except TypeError:
+            return None
+        if self.ensure_ascii and not body.isascii():
+            return None
+        return body
+
+    def dumps(self, obj, **kwargs):
+        if kwargs == {"separators": COMPACT}:
+            body = self._fast_dumps(obj)
+            if body is not None:
+                return body.decode()
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        body = self._fast_dumps(self._prepare_response_obj(args, kwargs))
+        if body is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(body + b"\n", mimetype=self.mimetype)
+
+
+PROVIDERS = {
+    "default": DefaultJSONProvider,
+    "orjson": OrjsonProvider,
+}
+
+
+def setup_json(app):
+    """
+    JSON_PROVIDER is "default", "orjson" or "auto" (orjson when it is installed).
+    """
+    name = app.config['JSON_PROVIDER']
+    if name == "auto":
+        name = "orjson" if orjson is not None else "default"
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("JSON_PROVIDER=orjson but orjson is not installed")
+    app.json = PROVIDERS[name](app)
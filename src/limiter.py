@@ -0,0 +1,196 @@
+"""
+Admission control, registered with setup_limiter(app, scan_endpoints) and
+shared with the async views of asgi.py. Off unless LIMIT_CONCURRENCY or
+LIMIT_RATE are set.
+
+Every request is put in a group: "write" for anything but GET/HEAD/OPTIONS,
+"scan" for the collection endpoints (full-table reads, searches, exports) and
+"read" for the rest. Two checks run before the view, both per worker process:
+
+* concurrency: at most LIMIT_CONCURRENCY requests of a group run at once; one
+  more is answered 503 right away instead of queueing behind them.
+* rate: a token bucket per (group, client address) refilled at LIMIT_RATE; an
+  empty bucket is answered 429. Behind a proxy, set TRUSTED_PROXIES to the
+  number of proxies in front of the app: the address is then read from the
+  X-Forwarded-For entry the outermost of them appended, counted from the
+  right, which the client cannot forge. Ids sent by the client (user_id in the
+  URL or body) are not used, the API does not authenticate them.
+
+Both answers carry Retry-After. Settings are "group=value" lists, 0 or a
+missing group meaning no limit, for example:
+
+    LIMIT_CONCURRENCY=write=8,scan=4
+    LIMIT_RATE=write=10:20,scan=5:10     tokens per second:burst
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import g, jsonify, request
+
+GROUPS = ("write", "scan", "read")
+EXEMPT = {"get_metrics", "get_healthz", "get_readyz", "static"}
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def parse_group_values(value, parse):
+    values = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        group, _, setting = item.partition("=")
+        values[group.strip()] = parse(setting.strip())
+    return values
+
+
+def client_address(forwarded_for, remote_addr, trusted_proxies):
+    """
+    Same rule as werkzeug's ProxyFix(x_for=trusted_proxies), for the ASGI side.
+    """
+    if trusted_proxies and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",")]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return remote_addr
+
+
+def retry_after(seconds):
+    return str(max(1, math.ceil(seconds)))
+
+
+def parse_rate(value):
+    rate, _, burst = value.partition(":")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(rate, 1.0)
+
+
+class TokenBuckets:
+    """
+    Token buckets per key, the least recently used dropped beyond max_keys.
+    """
+
+    def __init__(self, rate, burst, max_keys, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """
+        Returns 0 when a token was taken, otherwise the seconds until one is available.
+        """
+        now = self.clock()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def __len__(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+class Limiter:
+
+    def __init__(self, config, scan_endpoints):
+        self.scan_endpoints = set(scan_endpoints)
+        self.concurrency = {group: limit for group, limit in parse_group_values(config['LIMIT_CONCURRENCY'], int).items()
+                            if limit > 0}
+        self.slots = {group: threading.BoundedSemaphore(limit) for group, limit in self.concurrency.items()}
+        self.buckets = {group: TokenBuckets(rate, burst, config['LIMIT_MAX_CLIENTS'])
+                        for group, (rate, burst) in parse_group_values(config['LIMIT_RATE'], parse_rate).items()
+                        if rate > 0}
+        self.in_flight = dict.fromkeys(GROUPS, 0)
+        self.admitted = dict.fromkeys(GROUPS, 0)
+        self.rejected = {(group, reason): 0 for group in GROUPS for reason in ("concurrency", "rate")}
+        self._lock = threading.Lock()
+
+    def group(self, method, endpoint):
+        if method not in SAFE_METHODS:
+            return "write"
+        if endpoint in self.scan_endpoints:
+            return "scan"
+        return "read"
+
+    def enter(self, group, client):
+        """
+        Admits one request of group. Returns None, or (status, message, seconds
+        to wait) when it is rejected. Every admitted request must call leave().
+        """
+        buckets = self.buckets.get(group)
+        if buckets is not None:
+            wait = buckets.take(client)
+            if wait:
+                return self.reject(group, "rate", 429, "Too many requests", wait)
+
+        slots = self.slots.get(group)
+        if slots is not None and not slots.acquire(blocking=False):
+            return self.reject(group, "concurrency", 503, "Server busy, retry later", 1)
+
+        with self._lock:
+            self.admitted[group] += 1
+            self.in_flight[group] += 1
+        return None
+
+    def leave(self, group):
+        with self._lock:
+            self.in_flight[group] -= 1
+        slots = self.slots.get(group)
+        if slots is not None:
+            slots.release()
+
+    def reject(self, group, reason, status, message, wait):
+        with self._lock:
+            self.rejected[(group, reason)] += 1
+        return status, message, wait
+
+    def admit(self):
+        if request.endpoint is None or request.endpoint in EXEMPT:
+            return None
+        group = self.group(request.method, request.endpoint)
+        # remote_addr is the proxy-corrected address when TRUSTED_PROXIES installs ProxyFix
+        rejection = self.enter(group, request.remote_addr)
+        if rejection is not None:
+            status, message, wait = rejection
+            response = jsonify({"message": message})
+            response.status_code = status
+            response.headers["Retry-After"] = retry_after(wait)
+            return response
+        g.limiter_group = group
+        return None
+
+    def release(self, exc=None):
+        group = g.pop("limiter_group", None)
+        if group is not None:
+            self.leave(group)
+
+    def metric_lines(self):
+        with self._lock:
+            lines = ["# TYPE limiter_in_flight gauge"]
+            lines += ['limiter_in_flight{group="%s"} %d' % (group, self.in_flight[group]) for group in GROUPS]
+            lines.append("# TYPE limiter_concurrency_limit gauge")
+            lines += ['limiter_concurrency_limit{group="%s"} %d' % item for item in sorted(self.concurrency.items())]
+            lines.append("# TYPE limiter_admitted_total counter")
+            lines += ['limiter_admitted_total{group="%s"} %d' % (group, self.admitted[group]) for group in GROUPS]
+            lines.append("# TYPE limiter_rejected_total counter")
+            lines += ['limiter_rejected_total{group="%s",reason="%s"} %d' % (group, reason, count)
+                      for (group, reason), count in sorted(self.rejected.items())]
+        lines.append("# TYPE limiter_rate_clients gauge")
+        lines += ['limiter_rate_clients{group="%s"} %d' % (group, len(buckets)) for group, buckets in sorted(self.buckets.items())]
+        return lines
+
+
+def setup_limiter(app, scan_endpoints):
+    limiter = Limiter(app.config, scan_endpoints)
+    app.before_request(limiter.admit)
+    # teardown runs after a stream_with_context body is exhausted, so exports hold their slot until the end
+    app.teardown_request(limiter.release)
+    return limiter
@@ -0,0 +1,184 @@
+"""
+Helpers shared by the collection and detail endpoints: keyset pagination over
+the primary key, ?expand= of relationships, ?fields= column selection and
+?<foreign key>= / ?id__in= filters
+"""
+import base64
+import binascii
+from collections import namedtuple
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import selectinload
+from utils import APIException
+
+Page = namedtuple("Page", ["limit", "after"])
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        value = int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise APIException("Invalid cursor", status_code=400)
+    if value < 0:
+        raise APIException("Invalid cursor", status_code=400)
+    return value
+
+
+def parse_page(args, default_size, max_size):
+    """
+    Reads ?limit= and ?after= from the query string. The limit is clamped to
+    max_size so a client can never ask for the whole table in one page.
+    """
+    limit = args.get("limit")
+    if limit is None or limit == "":
+        limit = default_size
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise APIException("limit must be an integer", status_code=400)
+        if limit < 1:
+            raise APIException("limit must be greater than 0", status_code=400)
+    limit = min(limit, max_size)
+
+    after = args.get("after")
+    after = decode_cursor(after) if after else None
+    return Page(limit, after)
+
+
+def parse_limit(args, default, maximum):
+    """
+    ?limit= of the bounded, unpaginated lists (/search, /favorites/top).
+    """
+    value = args.get("limit")
+    if value is None or value == "":
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise APIException("limit must be an integer", status_code=400)
+    if value < 1 or value > maximum:
+        raise APIException(f"limit must be between 1 and {maximum}", status_code=400)
+    return value
+
+
+def page_statement(stmt, id_column, page):
+    # WHERE id > :after ORDER BY id LIMIT n+1 is an index range scan on the
+    # primary key, so the cost of a page does not grow with its depth. The
+    # extra row tells us whether there is a next page without a COUNT(*).
+    if page.after is not None:
+        stmt = stmt.where(id_column > page.after)
+    return stmt.order_by(id_column).limit(page.limit + 1)
+
+
+def page_results(rows, page, get_id=lambda row: row.id):
+    """
+    Trims the look-ahead row and returns (rows, next_cursor).
+    """
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        return rows, encode_cursor(get_id(rows[-1]))
+    return rows, None
+
+
+def parse_expand(args, allowed):
+    value = args.get("expand")
+    if not value:
+        return []
+    names = list(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    invalid = [name for name in names if name not in allowed]
+    if invalid:
+        raise APIException("Cannot expand %s, allowed: %s" % (", ".join(invalid), ", ".join(allowed)), status_code=400)
+    return names
+
+
+def related_models(model, names):
+    relationships = inspect(model).relationships
+    return [relationships[name].mapper.class_ for name in names]
+
+
+def expand_options(model, names):
+    # selectinload runs one extra SELECT ... WHERE id IN (...) per relationship,
+    # however many rows the page holds, instead of one lazy load per row.
+    return [selectinload(getattr(model, name)) for name in names]
+
+
+def serialize_expanded(entity, names):
+    result = entity.serialize()
+    for name in names:
+        value = getattr(entity, name)
+        if value is None:
+            result[name] = None
+        elif isinstance(value, list):
+            result[name] = [item.serialize() for item in value]
+        else:
+            result[name] = value.serialize()
+    return result
+
+
+def parse_fields(args, model):
+    """
+    Validates ?fields= against the model's columns and returns them in column
+    order, or None when every column is wanted. id is always included since
+    cursors and ETags are built from it.
+    """
+    value = args.get("fields")
+    if not value:
+        return None
+    columns = model.__table__.columns.keys()
+    names = set(name.strip() for name in value.split(",") if name.strip())
+    invalid = sorted(names - set(columns))
+    if invalid:
+        raise APIException("Unknown fields %s, allowed: %s" % (", ".join(invalid), ", ".join(columns)), status_code=400)
+    return [column for column in columns if column == "id" or column in names]
+
+
+def column_names(model):
+    return model.__table__.columns.keys()
+
+
+def field_statement(model, fields):
+    # Selecting only the requested columns keeps the rest out of both the
+    # database transfer and the JSON body.
+    return select(*[getattr(model, field) for field in fields])
+
+
+def project(result, fields, keep=()):
+    return {key: value for key, value in result.items() if key in fields or key in keep}
+
+
+def parse_id(name, value):
+    try:
+        value = int(value.strip())
+    except ValueError:
+        raise APIException(f"{name} must be an integer", status_code=400)
+    if value < 1:
+        raise APIException(f"{name} must be greater than 0", status_code=400)
+    return value
+
+
+def parse_filters(args, model, allowed, max_ids):
+    """
+    Turns ?<column>=<id> for the foreign keys in allowed and ?id__in=1,2,3 into
+    WHERE criteria. Every foreign key column is indexed and id__in is a primary
+    key lookup, so a filtered page never reads more of the table than it returns.
+    """
+    criteria = []
+    for name in allowed:
+        value = args.get(name)
+        if value is not None:
+            criteria.append(getattr(model, name) == parse_id(name, value))
+
+    value = args.get("id__in")
+    if value is not None:
+        ids = set(parse_id("id__in", item) for item in value.split(",") if item.strip())
+        if not ids:
+            raise APIException("id__in must list at least one id", status_code=400)
+        if len(ids) > max_ids:
+            raise APIException(f"id__in accepts at most {max_ids} ids", status_code=400)
+        criteria.append(model.id.in_(sorted(ids)))
+    return criteria
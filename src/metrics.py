@@ -0,0 +1,166 @@
+"""
+Per-route request metrics exposed at /metrics in the Prometheus text format.
+
+Flask before/after_request hooks time each request, and SQLAlchemy engine
+events count the statements (and the time spent in them) that the request
+issued. The async views of asgi.py record into the same Metrics and count their
+statements through request_statements. Everything is kept in plain dicts behind
+one lock, so the cost per request is a couple of perf_counter() calls and a few
+dict updates. Each gunicorn worker keeps its own numbers; scrape every worker or
+aggregate with the usual Prometheus functions.
+"""
+import threading
+import time
+from contextvars import ContextVar
+from bisect import bisect_left
+from flask import g, has_request_context, request, Response
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+# [count, seconds] of the request an async view is serving, which has no flask.g
+request_statements = ContextVar("request_statements", default=None)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        out = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            out.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+        out.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, self.count))
+        out.append('%s_sum{%s} %s' % (name, labels, self.sum))
+        out.append('%s_count{%s} %d' % (name, labels, self.count))
+        return out
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+
+    def __init__(self):
+        self.latency = {}
+        self.statements = {}
+        self.responses = {}
+        self.sql_count = {}
+        self.sql_seconds = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def add_collector(self, collector):
+        """
+        collector() returns extra exposition lines, e.g. cache or limiter state.
+        """
+        self.collectors.append(collector)
+
+    def record(self, endpoint, method, status, seconds, sql_count, sql_seconds):
+        with self._lock:
+            if endpoint not in self.latency:
+                self.latency[endpoint] = Histogram(LATENCY_BUCKETS)
+                self.statements[endpoint] = Histogram(STATEMENT_BUCKETS)
+                self.sql_count[endpoint] = 0
+                self.sql_seconds[endpoint] = 0.0
+            self.latency[endpoint].observe(seconds)
+            self.statements[endpoint].observe(sql_count)
+            self.sql_count[endpoint] += sql_count
+            self.sql_seconds[endpoint] += sql_seconds
+            key = (endpoint, method, status)
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self):
+        with self._lock:
+            lines = [
+                "# HELP http_request_duration_seconds Request latency by endpoint.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for endpoint, histogram in sorted(self.latency.items()):
+                lines += histogram.lines("http_request_duration_seconds", 'endpoint="%s"' % escape_label(endpoint))
+
+            lines += ["# HELP http_requests_total Responses by endpoint, method and status code.",
+                      "# TYPE http_requests_total counter"]
+            for (endpoint, method, status), count in sorted(self.responses.items()):
+                lines.append('http_requests_total{endpoint="%s",method="%s",status="%s"} %d'
+                             % (escape_label(endpoint), method, status, count))
+
+            lines += ["# HELP db_statements_per_request SQL statements issued by one request.",
+                      "# TYPE db_statements_per_request histogram"]
+            for endpoint, histogram in sorted(self.statements.items()):
+                lines += histogram.lines("db_statements_per_request", 'endpoint="%s"' % escape_label(endpoint))
+
+            lines += ["# HELP db_statements_total SQL statements by endpoint.",
+                      "# TYPE db_statements_total counter"]
+            for endpoint, count in sorted(self.sql_count.items()):
+                lines.append('db_statements_total{endpoint="%s"} %d' % (escape_label(endpoint), count))
+
+            lines += ["# HELP db_statement_seconds_total Time spent executing SQL by endpoint.",
+                      "# TYPE db_statement_seconds_total counter"]
+            for endpoint, seconds in sorted(self.sql_seconds.items()):
+                lines.append('db_statement_seconds_total{endpoint="%s"} %s' % (escape_label(endpoint), seconds))
+
+        for collector in self.collectors:
+            lines += collector()
+        return "\n".join(lines) + "\n"
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_started"].pop()
+    if has_request_context() and "metrics_sql_count" in g:
+        g.metrics_sql_count += 1
+        g.metrics_sql_seconds += time.perf_counter() - started
+    elif request_statements.get() is not None:
+        statements = request_statements.get()
+        statements[0] += 1
+        statements[1] += time.perf_counter() - started
+
+
+@event.listens_for(Engine, "handle_error")
+def drop_statement_timer(exception_context):
+    started = exception_context.connection.info.get("metrics_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def init_metrics(app):
+    metrics = Metrics()
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+        if "metrics_started" in g:
+            metrics.record(request.endpoint or "unmatched", request.method, response.status_code,
+                           time.perf_counter() - g.metrics_started, g.metrics_sql_count, g.metrics_sql_seconds)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def get_metrics():
+        return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+    return metrics
@@ -4,9 +4,9 @@ db = SQLAlchemy()
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(50), nullable=False)
-    email = db.Column(db.String(120), nullable=False)
-    favorites = db.relationship("Favorite", backref="user", lazy=True)
+    name = db.Column(db.String(50), nullable=False, unique=True, index=True)
+    email = db.Column(db.String(120), nullable=False, unique=True, index=True)
+    favorites = db.relationship("Favorite", backref="user", lazy=True, passive_deletes="all")
 
     def __repr__(self):
         return '<User %r>' % self.id
@@ -21,9 +21,9 @@ class User(db.Model):
 class Character(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
-    specie_id = db.Column(db.Integer, db.ForeignKey("specie.id"), nullable=False)
-    planet_id = db.Column(db.Integer, db.ForeignKey("planet.id"), nullable=False)
-    favorites = db.relationship("Favorite", backref="character", lazy=True)
+    specie_id = db.Column(db.Integer, db.ForeignKey("specie.id"), nullable=False, index=True)
+    planet_id = db.Column(db.Integer, db.ForeignKey("planet.id"), nullable=False, index=True)
+    favorites = db.relationship("Favorite", backref="character", lazy=True, passive_deletes="all")
 
     def __repr__(self):
         return '<Character %r>' % self.id
@@ -41,7 +41,8 @@ class Planet(db.Model):
     name = db.Column(db.String(50), nullable=False)
     clima = db.Column(db.String(100), nullable=False)
     characters = db.relationship("Character", backref="planet", lazy=True)
-    favorites = db.relationship("Favorite", backref="planet", lazy=True)
+    species = db.relationship("Specie", backref="planet", lazy=True)
+    favorites = db.relationship("Favorite", backref="planet", lazy=True, passive_deletes="all")
 
     def __repr__(self):
         return '<Planet %r>' % self.id
@@ -56,9 +57,9 @@ class Planet(db.Model):
 class Specie(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), nullable=False)
-    planet_id = db.Column(db.Integer, db.ForeignKey("planet.id"), nullable=True)
+    planet_id = db.Column(db.Integer, db.ForeignKey("planet.id"), nullable=True, index=True)
     characters = db.relationship("Character", backref="specie", lazy=True)
-    favorites = db.relationship("Favorite", backref="specie", lazy=True)
+    favorites = db.relationship("Favorite", backref="specie", lazy=True, passive_deletes="all")
 
     def __repr__(self):
         return '<Specie %r>' % self.id
@@ -73,9 +74,18 @@ class Specie(db.Model):
 class Favorite(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable = False)
-    planet_id = db.Column(db.Integer, db.ForeignKey("planet.id"), nullable = True)
-    specie_id = db.Column(db.Integer, db.ForeignKey("specie.id"), nullable = True)
-    character_id = db.Column(db.Integer, db.ForeignKey("character.id"), nullable = True)
+    planet_id = db.Column(db.Integer, db.ForeignKey("planet.id"), nullable = True, index=True)
+    specie_id = db.Column(db.Integer, db.ForeignKey("specie.id"), nullable = True, index=True)
+    character_id = db.Column(db.Integer, db.ForeignKey("character.id"), nullable = True, index=True)
+
+    # (user_id, id) serves a user's favorites page by page.
+    # One favorite per (user, target); partial so each index only holds rows of its own type.
+    __table_args__ = (db.Index("ix_favorite_user_id_id", "user_id", "id"),) + tuple(
+        db.Index("uq_favorite_user_" + column, "user_id", column, unique=True,
+                 postgresql_where=db.text(column + " IS NOT NULL"),
+                 sqlite_where=db.text(column + " IS NOT NULL"))
+        for column in ("character_id", "planet_id", "specie_id")
+    )
 
     def __repr__(self):
         return '<Favorite %r>' % self.id
@@ -88,3 +98,35 @@ class Favorite(db.Model):
             "specie_id": self.specie_id,
             "character_id": self.character_id
         }
+
+class TableVersion(db.Model):
+    """
+    Counters split in slots: every transaction that writes a table adds 1 to one
+    slot of that table when it commits (see versioning.py), and the version of the
+    table is the sum of its slots. Responses use it to build their ETag.
+    """
+    __tablename__ = "table_version"
+    table_name = db.Column(db.String(50), primary_key=True)
+    slot = db.Column(db.Integer, primary_key=True, autoincrement=False, default=0)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<TableVersion %r %r>' % (self.table_name, self.slot)
+
+class FavoriteCount(db.Model):
+    """
+    How many users have each character, planet and specie in their favorites,
+    kept up to date by favorites.py in the same transaction as the favorite
+    itself. `flask rebuild-favorite-counts` recomputes it from the favorite table.
+    """
+    __tablename__ = "favorite_count"
+    target_type = db.Column(db.String(20), primary_key=True)
+    target_id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    # GET /favorites/top reads the first N entries of this index for one type
+    __table_args__ = (db.Index("ix_favorite_count_top", target_type, count.desc(), target_id),)
+
+    def __repr__(self):
+        return '<FavoriteCount %r %r>' % (self.target_type, self.target_id)
+
@@ -0,0 +1,97 @@
+"""
+EXPLAIN checks for the hot queries issued by app.py. Each query is explained
+against the current database and any sequential scan is reported, so a missing
+or unusable index shows up before it shows up in production latency.
+"""
+import json
+from sqlalchemy import select, text
+from models import db, User, Character, Planet, Specie, Favorite, FavoriteCount
+from search import name_criterion
+
+
+def hot_queries():
+    """
+    Same shapes as the statements built in app.py; ids are placeholders.
+    """
+    return {
+        "users page": select(User).where(User.id > 1).order_by(User.id).limit(101),
+        "characters page": select(Character).where(Character.id > 1).order_by(Character.id).limit(101),
+        "planets page": select(Planet).where(Planet.id > 1).order_by(Planet.id).limit(101),
+        "species page": select(Specie).where(Specie.id > 1).order_by(Specie.id).limit(101),
+        "favorites page": select(Favorite).where(Favorite.id > 1).order_by(Favorite.id).limit(101),
+        "user by id": select(User).where(User.id == 1),
+        "character by id": select(Character).where(Character.id == 1),
+        "planet by id": select(Planet).where(Planet.id == 1),
+        "specie by id": select(Specie).where(Specie.id == 1),
+        "user favorites page": select(Favorite).where(Favorite.user_id == 1, Favorite.id > 1).order_by(Favorite.id).limit(101),
+        "favorite character lookup": select(Favorite).filter_by(user_id=1, character_id=1),
+        "favorite planet lookup": select(Favorite).filter_by(user_id=1, planet_id=1),
+        "favorite specie lookup": select(Favorite).filter_by(user_id=1, specie_id=1),
+        "characters by planet": select(Character).where(Character.planet_id == 1),
+        "characters by specie": select(Character).where(Character.specie_id == 1),
+        "species by planet": select(Specie).where(Specie.planet_id == 1),
+        "characters by planet page": select(Character).where(Character.planet_id == 1, Character.id > 1).order_by(Character.id).limit(101),
+        "characters by ids": select(Character).where(Character.id.in_([1, 2, 3])).order_by(Character.id).limit(101),
+        "top favorited characters": select(Character.id, FavoriteCount.count).join(Character, Character.id == FavoriteCount.target_id)
+                                    .where(FavoriteCount.target_type == "character", FavoriteCount.count > 0)
+                                    .order_by(FavoriteCount.count.desc(), FavoriteCount.target_id).limit(10),
+        "characters by name": select(Character).where(name_criterion(Character, "sky")).order_by(Character.id).limit(101),
+        "planets by name": select(Planet).where(name_criterion(Planet, "sky")).order_by(Planet.id).limit(101),
+        "species by name": select(Specie).where(name_criterion(Specie, "sky")).order_by(Specie.id).limit(101),
+    }
+
+
+def _sql(stmt, dialect):
+    return str(stmt.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+def _sqlite_seq_scans(sql):
+    rows = db.session.execute(text("EXPLAIN QUERY PLAN " + sql)).all()
+    # SEARCH means an index (or rowid) lookup; SCAN walks the whole table or index,
+    # except on an FTS5 table, where "VIRTUAL TABLE INDEX" is the full-text index lookup
+    return [row[-1] for row in rows if row[-1].startswith("SCAN") and "VIRTUAL TABLE INDEX" not in row[-1]]
+
+
+def _postgresql_seq_scans(sql):
+    # With seqscan disabled the planner only falls back to one when no index applies
+    db.session.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = db.session.execute(text("EXPLAIN (FORMAT JSON) " + sql)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    found = []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan":
+            found.append("Seq Scan on " + node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    return found
+
+
+EXPLAIN_DIALECTS = ("sqlite", "postgresql")
+
+
+def seq_scans(stmt):
+    dialect = db.session.get_bind().dialect
+    sql = _sql(stmt, dialect)
+    if dialect.name == "sqlite":
+        return _sqlite_seq_scans(sql)
+    if dialect.name == "postgresql":
+        return _postgresql_seq_scans(sql)
+    raise NotImplementedError("EXPLAIN checks support %s, not %s" % (" and ".join(EXPLAIN_DIALECTS), dialect.name))
+
+
+def check_hot_queries():
+    """
+    Returns {name: [offending plan lines]} for every hot query that is not index-only.
+    """
+    failures = {}
+    try:
+        for name, stmt in hot_queries().items():
+            scans = seq_scans(stmt)
+            if scans:
+                failures[name] = scans
+    finally:
+        db.session.rollback()
+    return failures
@@ -0,0 +1,101 @@
+"""
+Name search for GET /search?q= and the ?name= filter of the catalogue collections.
+
+Matching is case-insensitive substring matching on name, served by an index
+created in migration 7d2f5b8c1a64: an FTS5 trigram table per entity on SQLite
+(<table>_fts) and a pg_trgm GIN index on PostgreSQL. Trigram indexes need at
+least three characters, hence SEARCH_MIN_LENGTH. A SQLite database built with
+db.create_all() has no FTS tables; it falls back to LIKE, same results, no index.
+
+Results are ranked exact match first, then prefix matches, then other
+substrings, shorter names first within each group. The order is the same on
+both databases, so every type can be queried for its own top N and merged.
+"""
+from flask import current_app
+from sqlalchemy import case, column, func, literal_column, select, table, text
+from models import db, Character, Planet, Specie
+from utils import APIException
+
+SEARCHABLE = {
+    "character": Character,
+    "planet": Planet,
+    "specie": Specie,
+}
+
+_fts_tables = {}
+
+
+def parse_query(args, name):
+    """
+    Returns the stripped ?<name>= value, None when absent, 400 when too short or too long.
+    """
+    value = args.get(name)
+    if value is None:
+        return None
+    value = value.strip()
+    min_length = current_app.config['SEARCH_MIN_LENGTH']
+    if len(value) < min_length:
+        raise APIException(f"{name} must be at least {min_length} characters", status_code=400)
+    if len(value) > 100:
+        raise APIException(f"{name} must be at most 100 characters", status_code=400)
+    return value
+
+
+def parse_types(args):
+    value = args.get("type")
+    if not value:
+        return list(SEARCHABLE)
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SEARCHABLE]
+    if unknown:
+        raise APIException("Unknown type: " + ", ".join(unknown) + ". Allowed: " + ", ".join(SEARCHABLE), status_code=400)
+    return list(dict.fromkeys(names))
+
+
+def like_pattern(value):
+    return "%" + value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def has_fts(model):
+    name = model.__tablename__ + "_fts"
+    if name not in _fts_tables:
+        found = db.session.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name})
+        _fts_tables[name] = found.first() is not None
+    return _fts_tables[name]
+
+
+def name_criterion(model, value):
+    """
+    WHERE clause matching rows whose name contains value.
+    """
+    if db.session.get_bind().dialect.name == "sqlite" and has_fts(model):
+        fts = table(model.__tablename__ + "_fts", column("name"))
+        phrase = '"' + value.replace('"', '""') + '"'
+        return model.id.in_(select(literal_column("rowid")).select_from(fts).where(fts.c.name.match(phrase)))
+    return model.name.ilike(like_pattern(value), escape="\\")
+
+
+def rank_columns(model, value):
+    group = case(
+        (func.lower(model.name) == value.lower(), 0),
+        (model.name.ilike(like_pattern(value)[1:], escape="\\"), 1),
+        else_=2,
+    )
+    return group, func.length(model.name)
+
+
+def search(value, types, limit):
+    """
+    Top `limit` matches over the given types as [{"type", "id", "name"}], best first.
+    """
+    found = []
+    for name in types:
+        model = SEARCHABLE[name]
+        group, length = rank_columns(model, value)
+        stmt = (select(model.id, model.name, group.label("group"), length.label("length"))
+                .where(name_criterion(model, value))
+                .order_by(group, length, model.name, model.id)
+                .limit(limit))
+        found += [(row.group, row.length, row.name, name, row.id) for row in db.session.execute(stmt)]
+    found.sort()
+    return [{"type": name, "id": entity_id, "name": entity_name} for _, _, entity_name, name, entity_id in found[:limit]]
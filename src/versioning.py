@@ -0,0 +1,157 @@
+"""
+Per-table version counters and conditional GET support.
+
+Every transaction that flushes or issues bulk insert/update/delete statements
+through the session records the tables it touched, and bumps their
+table_version counters right before it commits, in the same transaction. The
+counters live in the database rather than in the worker so that all gunicorn
+workers agree on them. A GET decorated with @conditional reads the versions of
+the tables it depends on (one primary key range query), hashes them with the
+request into a strong ETag and answers If-None-Match with a 304 without running
+the view at all.
+
+A bump locks the counter row until commit, so each table has VERSION_SLOTS rows
+and a transaction bumps a random one: writers to the same table only wait on
+each other when they pick the same slot, and only for the time of the commit.
+The version is the sum of the slots, which moves with every committed write.
+"""
+import functools
+import hashlib
+import random
+from flask import current_app, g, request, Response
+from sqlalchemy import BigInteger, cast, event, func, insert, select, update
+from sqlalchemy.orm import Session
+from bulk import UPSERT_INSERTS
+from listing import parse_expand, related_models
+from models import db, TableVersion
+
+VERSIONS = TableVersion.__table__
+VERSION_SLOTS = 16
+CHANGED_TABLES = "versioning_changed_tables"
+
+
+def bump_versions(connection, tables):
+    """
+    Adds 1 to one slot of every table in tables, locking the rows in table order.
+    """
+    tables = sorted(set(tables) - {VERSIONS.name})
+    if not tables:
+        return
+    slot = random.randrange(VERSION_SLOTS)
+    name = connection.dialect.name
+    if name in UPSERT_INSERTS:
+        # Tables created with db.create_all() have no rows until their first write
+        stmt = UPSERT_INSERTS[name](VERSIONS).values([{"table_name": table, "slot": slot, "version": 1} for table in tables])
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[VERSIONS.c.table_name, VERSIONS.c.slot],
+            set_={"version": VERSIONS.c.version + 1},
+        ))
+        return
+    result = connection.execute(
+        update(VERSIONS).where(VERSIONS.c.table_name.in_(tables), VERSIONS.c.slot == slot).values(version=VERSIONS.c.version + 1)
+    )
+    if result.rowcount < len(tables):
+        known = set(connection.execute(
+            select(VERSIONS.c.table_name).where(VERSIONS.c.table_name.in_(tables), VERSIONS.c.slot == slot)
+        ).scalars())
+        connection.execute(insert(VERSIONS), [{"table_name": name, "slot": slot, "version": 1} for name in tables if name not in known])
+
+
+def record_changes(session, tables):
+    session.info.setdefault(CHANGED_TABLES, set()).update(tables)
+
+
+@event.listens_for(Session, "after_flush")
+def record_flushed_tables(session, flush_context):
+    record_changes(session, {obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)})
+
+
+@event.listens_for(Session, "do_orm_execute")
+def record_executed_tables(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        record_changes(orm_execute_state.session, [orm_execute_state.statement.table.name])
+
+
+@event.listens_for(Session, "before_commit")
+def bump_changed_tables(session):
+    # Savepoints leave the bump to the transaction around them
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    tables = session.info.pop(CHANGED_TABLES, None)
+    if tables:
+        bump_versions(session.connection(), tables)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def forget_changed_tables(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(CHANGED_TABLES, None)
+
+
+def versions_statement(tables):
+    version = cast(func.sum(VERSIONS.c.version), BigInteger).label("version")
+    return select(VERSIONS.c.table_name, version).where(VERSIONS.c.table_name.in_(tables)).group_by(VERSIONS.c.table_name)
+
+
+def table_versions(tables):
+    versions = dict.fromkeys(tables, 0)
+    versions.update({row.table_name: row.version for row in db.session.execute(versions_statement(tables))})
+    return versions
+
+
+def make_etag(full_path, accept, versions):
+    key = "|".join([full_path, accept] + ["%s:%s" % (name, versions[name]) for name in sorted(versions)])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def compute_etag(versions):
+    return make_etag(request.full_path, request.headers.get("Accept", ""), versions)
+
+
+def request_version(model):
+    """
+    Version of model's table read by @conditional for the current request, None outside one.
+    """
+    return g.get("table_versions", {}).get(model.__tablename__)
+
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+
+def conditional(*models, expand=()):
+    """
+    Adds an ETag to 200 responses of the decorated GET and answers a matching
+    If-None-Match with 304 (If-None-Match: * only when the view answered 200). models are every table the response is built from;
+    expand lists the relationships of models[0] the route accepts in ?expand=,
+    whose tables only count when they are requested.
+    """
+    tables = [model.__tablename__ for model in models]
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            related = related_models(models[0], parse_expand(request.args, expand)) if expand else []
+            # Read the versions before the data: if a write lands in between,
+            # the response is newer than its ETag and the next poll refreshes it.
+            g.table_versions = table_versions(sorted(set(tables + [model.__tablename__ for model in related])))
+            etag = compute_etag(g.table_versions)
+            if_none_match = request.if_none_match
+            # Weak match: compress.py serves compressed bodies under W/"<etag>". A real
+            # ETag was only ever sent with a 200, but "*" needs the view to tell whether
+            # the resource exists.
+            if if_none_match.contains_weak(etag) and not if_none_match.star_tag:
+                return not_modified(etag)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                if if_none_match.star_tag:
+                    response.close()
+                    return not_modified(etag)
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,133 @@
+"""
+Fixtures shared by the tests: a SQLite database created and seeded once per
+session, `client`, which runs each test against the Flask app and against
+asgi.application, `metric`, which reads /metrics through that client, and
+`session` for looking at the database directly.
+
+DATABASE_URL has to be set before app.py is imported, since the app reads its
+settings at import time.
+"""
+import os
+import re
+import shutil
+import tempfile
+from collections import namedtuple
+
+DATABASE_DIR = tempfile.mkdtemp(prefix="starwars-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(DATABASE_DIR, "test.db")
+os.environ["ADMIN_ENABLED"] = "false"
+# Tests that need limits install them on the shared limiter themselves
+os.environ["LIMIT_CONCURRENCY"] = ""
+os.environ["LIMIT_RATE"] = ""
+os.environ["TRUSTED_PROXIES"] = "0"
+
+import pytest  # noqa: E402
+from starlette.testclient import TestClient  # noqa: E402
+from app import app  # noqa: E402
+from asgi import application  # noqa: E402
+from favorites import rebuild_counts  # noqa: E402
+from models import db, User, Character, Planet, Specie, Favorite  # noqa: E402
+
+# The body is the bytes on the wire, before any Content-Encoding is undone
+Reply = namedtuple("Reply", ["status_code", "headers", "body"])
+
+
+class FlaskClient:
+
+    name = "flask"
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers=None, json=None):
+        response = self.client.open(path, method=method, headers=headers or {}, json=json)
+        return Reply(response.status_code, response.headers, response.data)
+
+    def get(self, path, **headers):
+        return self.request("GET", path, headers)
+
+
+class AsgiClient:
+
+    name = "asgi"
+
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, method, path, headers=None, json=None):
+        # httpx asks for compressed bodies unless told otherwise, the Flask test client does not
+        headers = dict({"Accept-Encoding": "identity"}, **(headers or {}))
+        with self.client.stream(method, path, headers=headers, json=json) as response:
+            return Reply(response.status_code, response.headers, b"".join(response.iter_raw()))
+
+    def get(self, path, **headers):
+        return self.request("GET", path, headers)
+
+
+def seed():
+    planets = [Planet(name="Planet %d" % i, clima="Clima %d" % i) for i in range(1, 31)]
+    db.session.add_all(planets)
+    db.session.flush()
+    species = [Specie(name="Specie %d" % i, planet_id=planets[i % 5].id) for i in range(1, 11)]
+    db.session.add_all(species)
+    db.session.flush()
+    characters = [Character(name="Character %d" % i, planet_id=planets[i % 5].id, specie_id=species[i % 3].id)
+                  for i in range(1, 41)]
+    users = [User(name="user%d" % i, email="user%d@example.com" % i) for i in range(1, 6)]
+    db.session.add_all(characters + users)
+    db.session.flush()
+    db.session.add_all([Favorite(user_id=users[0].id, character_id=characters[0].id),
+                        Favorite(user_id=users[0].id, planet_id=planets[0].id),
+                        Favorite(user_id=users[1].id, specie_id=species[0].id)])
+    db.session.commit()
+    # The favorites above bypassed favorites.py, which keeps the counters
+    rebuild_counts()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    with app.app_context():
+        db.create_all()
+        seed()
+    yield
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(DATABASE_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def session():
+    """
+    The app's db.session, for looking at or preparing rows outside a request.
+    """
+    with app.app_context():
+        yield db.session
+        db.session.rollback()
+
+
+@pytest.fixture(scope="session")
+def flask_client():
+    return FlaskClient(app)
+
+
+@pytest.fixture(scope="session")
+def asgi_client():
+    with TestClient(application) as client:
+        yield AsgiClient(client)
+
+
+@pytest.fixture(params=["flask", "asgi"])
+def client(request):
+    return request.getfixturevalue(request.param + "_client")
+
+
+@pytest.fixture
+def metric(client):
+    """
+    metric(line) reads the value of one exposition line of GET /metrics, 0 when absent.
+    """
+    def read(line):
+        body = client.get("/metrics").body.decode()
+        match = re.search("^" + re.escape(line) + r" (\S+)$", body, re.MULTILINE)
+        return float(match.group(1)) if match else 0.0
+    return read
@@ -0,0 +1,83 @@
+"""
+POST /<collection>/batch: per-item validation, one transaction, and whole-batch
+answers when the database refuses it.
+"""
+import json
+from sqlalchemy import select
+import bulk
+from models import User
+
+
+def post(client, path, items):
+    response = client.request("POST", path, json=items)
+    return response.status_code, json.loads(response.body)
+
+
+def test_creates_and_reports_each_item(client):
+    status, body = post(client, "/planets/batch", [
+        {"name": client.name + " Tatooine", "clima": "arid"},
+        {"name": client.name + " Hoth"},
+        "not an object",
+        {"name": client.name + " Dagobah", "clima": "murky"},
+    ])
+    assert status == 201
+    assert (body["created"], body["failed"]) == (2, 2)
+    assert [result["status"] for result in body["results"]] == ["created", "error", "error", "created"]
+    assert body["results"][1]["error"] == "Faltan datos: clima"
+    first, last = body["results"][0]["id"], body["results"][3]["id"]
+    assert last > first
+    planet = json.loads(client.get("/planet/%d" % last).body)["result"]
+    assert planet["name"] == client.name + " Dagobah"
+
+
+def test_checks_types_and_references(client):
+    status, body = post(client, "/characters/batch", [
+        {"name": "Typed", "specie_id": True, "planet_id": 1},
+        {"name": 5, "specie_id": 1, "planet_id": 1},
+        {"name": "Lost", "specie_id": 1, "planet_id": 999},
+    ])
+    assert status == 400
+    assert [result["error"] for result in body["results"]] == [
+        "Invalid id: specie_id", "Invalid type: name", "Not found: planet_id"]
+
+
+def test_checks_string_lengths(client):
+    status, body = post(client, "/users/batch", [
+        {"name": "n" * 51, "email": client.name + "-long@example.com"},
+        {"name": client.name + "-short", "email": "e" * 121},
+        {"name": client.name + "-fits", "email": client.name + "-fits@example.com"},
+    ])
+    assert status == 201
+    assert [result.get("error") for result in body["results"]] == [
+        "Too long: name (max 50)", "Too long: email (max 120)", None]
+
+
+def test_checks_unique_values(client):
+    status, body = post(client, "/users/batch", [
+        {"name": "user1", "email": client.name + "-taken@example.com"},
+        {"name": client.name + "-twice", "email": client.name + "-twice@example.com"},
+        {"name": client.name + "-twice", "email": client.name + "-again@example.com"},
+    ])
+    assert status == 201
+    assert [result.get("error") for result in body["results"]] == [
+        "Already exists: name", None, "Already exists: name"]
+
+
+def test_conflict_rolls_back_the_batch(client, session, monkeypatch):
+    # As if another request inserted user1 between the uniqueness check and the insert
+    monkeypatch.setattr(bulk, "existing_values", lambda column, values: set())
+    status, body = post(client, "/users/batch", [
+        {"name": client.name + "-raced", "email": client.name + "-raced@example.com"},
+        {"name": "user1", "email": client.name + "-dup@example.com"},
+    ])
+    assert status == 409
+    assert "results" not in body
+    assert session.execute(select(User.id).where(User.name == client.name + "-raced")).first() is None
+
+
+def test_rejects_bad_batches(client):
+    assert post(client, "/species/batch", {"name": "x"})[0] == 400
+    assert post(client, "/species/batch", [])[0] == 400
+    status, body = post(client, "/species/batch", [{"name": "x", "planet_id": 1}] * 1001)
+    assert status == 413
+    assert body["message"] == "Batch too large, the maximum is 1000 items"
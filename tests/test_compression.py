@@ -0,0 +1,47 @@
+"""
+Negotiated compression, on the Flask routes and on the async views of asgi.py.
+"""
+import gzip
+import json
+from app import compression
+
+
+def test_compresses_large_responses(client):
+    identity = client.get("/characters")
+    encoded = client.get("/characters", **{"Accept-Encoding": "gzip"})
+    assert len(identity.body) >= compression.min_size
+    assert encoded.status_code == 200
+    assert encoded.headers["Content-Encoding"] == "gzip"
+    assert encoded.headers["Vary"] == "Accept-Encoding"
+    assert int(encoded.headers["Content-Length"]) == len(encoded.body)
+    assert gzip.decompress(encoded.body) == identity.body
+    assert encoded.headers["ETag"] == "W/" + identity.headers["ETag"]
+
+
+def test_weak_etag_matches(client):
+    encoded = client.get("/characters", **{"Accept-Encoding": "gzip"})
+    again = client.get("/characters", **{"Accept-Encoding": "gzip", "If-None-Match": encoded.headers["ETag"]})
+    assert again.status_code == 304
+
+
+def test_prefers_configured_order(client):
+    encoded = client.get("/characters", **{"Accept-Encoding": "gzip, br, zstd"})
+    assert encoded.headers["Content-Encoding"] == compression.preference[0]
+
+
+def test_leaves_small_responses(client):
+    response = client.get("/character/1", **{"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert json.loads(response.body)["result"]["name"] == "Character 1"
+
+
+def test_identity_when_not_accepted(client):
+    response = client.get("/characters", **{"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+
+
+def test_counts_bytes(client):
+    before = compression.bytes_in["gzip"], compression.bytes_out["gzip"]
+    response = client.get("/planets", **{"Accept-Encoding": "gzip"})
+    assert compression.bytes_in["gzip"] - before[0] == len(gzip.decompress(response.body))
+    assert compression.bytes_out["gzip"] - before[1] == len(response.body)
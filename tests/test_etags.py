@@ -0,0 +1,68 @@
+"""
+ETags built from the table versions (versioning.py) and conditional GETs.
+"""
+import json
+import pytest
+
+
+@pytest.fixture
+def planet(client):
+    created = client.request("POST", "/planet", json={"name": client.name + " Bespin", "clima": "temperate"})
+    planet_id = json.loads(created.body)["planet"]["id"]
+    yield planet_id
+    client.request("DELETE", "/planet/%d" % planet_id)
+
+
+@pytest.mark.parametrize("path", ["/planet/999", "/character/0", "/user/999", "/user/999/favorites"])
+def test_star_does_not_match_missing_resources(client, path):
+    response = client.get(path, **{"If-None-Match": "*"})
+    assert response.status_code == 404
+    assert "ETag" not in response.headers
+
+
+@pytest.mark.parametrize("path", ["/planet/1", "/characters", "/user/1/favorites", "/planet/1?expand=characters"])
+def test_star_matches_existing_resources(client, path):
+    etag = client.get(path).headers["ETag"]
+    response = client.get(path, **{"If-None-Match": "*"})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_etag_depends_on_path_and_accept(client):
+    etags = {client.get(path, Accept=accept).headers["ETag"]
+             for path in ("/planets", "/planets?limit=5") for accept in ("application/json", "*/*")}
+    assert len(etags) == 4
+
+
+def test_stale_etag_gets_the_new_body(client, planet):
+    path = "/planet/%d" % planet
+    before = client.get(path)
+    client.request("PUT", path, json={"clima": "cloudy"})
+    after = client.get(path, **{"If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200
+    assert after.headers["ETag"] != before.headers["ETag"]
+    # The entity cache must not serve the old row under the new ETag
+    assert json.loads(after.body)["result"]["clima"] == "cloudy"
+
+
+def test_writes_to_other_tables_keep_the_etag(client, planet):
+    etag = client.get("/planets").headers["ETag"]
+    assert client.request("POST", "/favorite/character/2", json={"user_id": 3}).status_code == 201
+    assert client.request("DELETE", "/favorite/character/2", json={"user_id": 3}).status_code == 200
+    assert client.get("/planets", **{"If-None-Match": etag}).status_code == 304
+
+
+def test_expanded_tables_count(client, planet):
+    path = "/planet/%d?expand=characters" % planet
+    etag = client.get(path).headers["ETag"]
+    # Without ?expand= the character table is not part of the ETag
+    plain = client.get("/planet/%d" % planet).headers["ETag"]
+    created = client.request("POST", "/character", json={"name": "Lando", "specie_id": 1, "planet_id": planet})
+    character_id = json.loads(created.body)["character"]["id"]
+    try:
+        response = client.get(path, **{"If-None-Match": etag})
+        assert response.status_code == 200
+        assert [character["name"] for character in json.loads(response.body)["result"]["characters"]] == ["Lando"]
+        assert client.get("/planet/%d" % planet, **{"If-None-Match": plain}).status_code == 304
+    finally:
+        client.request("DELETE", "/character/%d" % character_id)
@@ -0,0 +1,175 @@
+"""
+Favorites: single adds and removes, the batch endpoint, the counters behind
+GET /favorites/top and their rebuild, and the user's favorites listing.
+"""
+import json
+import uuid
+import pytest
+from sqlalchemy import delete, select, update
+import favorites
+from app import app
+from models import db, User, Planet, Favorite, FavoriteCount
+
+
+def body(response):
+    return json.loads(response.body)
+
+
+def forget(*deletes):
+    """
+    Deletes what a test created and recounts. Not the session fixture: its app context
+    would be the one the ASGI client's Flask requests run in, from another thread.
+    """
+    with app.app_context():
+        for model, criterion in deletes:
+            db.session.execute(delete(model).where(criterion))
+        db.session.commit()
+        favorites.rebuild_counts()
+
+
+@pytest.fixture
+def user(client):
+    name = "fan-" + uuid.uuid4().hex[:8]
+    created = client.request("POST", "/users", json={"name": name, "email": name + "@example.com"})
+    user_id = body(created)["user"]["id"]
+    yield user_id
+    forget((Favorite, Favorite.user_id == user_id), (User, User.id == user_id))
+
+
+@pytest.fixture
+def planet(client):
+    created = client.request("POST", "/planet", json={"name": "Fav " + uuid.uuid4().hex[:8], "clima": "mild"})
+    planet_id = body(created)["planet"]["id"]
+    yield planet_id
+    forget((Favorite, Favorite.planet_id == planet_id), (Planet, Planet.id == planet_id))
+
+
+def top_count(client, target_type, target_id):
+    results = body(client.get("/favorites/top?type=%s&limit=100" % target_type))["result"]
+    return next((row["favorites"] for row in results if row["id"] == target_id), 0)
+
+
+def test_add_is_idempotent(client, user):
+    created = client.request("POST", "/favorite/character/3", json={"user_id": user})
+    assert created.status_code == 201
+    assert body(created)["favorite"]["character_id"] == 3
+    again = client.request("POST", "/favorite/character/3", json={"user_id": user})
+    assert again.status_code == 200
+    assert body(again)["msg"] == "Character already exists in user favorites"
+    listed = body(client.get("/user/%d/favorites" % user))["result"]
+    assert [favorite["character_id"] for favorite in listed] == [3]
+
+
+@pytest.mark.parametrize("payload, status, message", [
+    ({"user_id": 999999}, 404, "User not found"),
+    ({}, 400, "User ID is required"),
+    ({"user_id": True}, 400, "User ID must be an integer"),
+    ({"user_id": "1"}, 400, "User ID must be an integer"),
+])
+def test_add_rejects_bad_users(client, payload, status, message):
+    response = client.request("POST", "/favorite/planet/1", json=payload)
+    assert response.status_code == status
+    assert body(response)["error"] == message
+
+
+def test_add_unknown_target(client, user):
+    response = client.request("POST", "/favorite/specie/999999", json={"user_id": user})
+    assert response.status_code == 404
+
+
+def test_remove(client, user):
+    client.request("POST", "/favorite/planet/2", json={"user_id": user})
+    assert client.request("DELETE", "/favorite/planet/2", json={"user_id": user}).status_code == 200
+    assert client.request("DELETE", "/favorite/planet/2", json={"user_id": user}).status_code == 404
+    assert body(client.get("/user/%d/favorites" % user))["result"] == []
+
+
+def test_user_with_favorites_cannot_be_deleted(client, user):
+    client.request("POST", "/favorite/planet/2", json={"user_id": user})
+    response = client.request("DELETE", "/user/%d" % user)
+    assert response.status_code == 409
+    assert body(response)["msg"] == "User still has favorites"
+
+
+def test_listing_pages_and_streams(client, user):
+    for character_id in (4, 5, 6):
+        client.request("POST", "/favorite/character/%d" % character_id, json={"user_id": user})
+    page = body(client.get("/user/%d/favorites?limit=2&fields=character_id" % user))
+    assert [favorite["character_id"] for favorite in page["result"]] == [4, 5]
+    rest = body(client.get("/user/%d/favorites?limit=2&after=%s" % (user, page["next"])))
+    assert [favorite["character_id"] for favorite in rest["result"]] == [6]
+    assert rest["next"] is None
+
+    stream = client.get("/user/%d/favorites?stream=1" % user)
+    assert stream.headers["Content-Type"] == "application/x-ndjson"
+    assert [json.loads(line)["character_id"] for line in stream.body.decode().splitlines()] == [4, 5, 6]
+
+
+def test_unknown_user_listing(client):
+    assert client.get("/user/999999/favorites").status_code == 404
+    assert client.get("/user/999999/favorites?stream=1").status_code == 404
+
+
+def test_counters_follow_adds_and_removes(client, user, planet):
+    other = body(client.request("POST", "/users", json={"name": "other-" + uuid.uuid4().hex[:8],
+                                                        "email": uuid.uuid4().hex[:8] + "@example.com"}))["user"]["id"]
+    client.request("POST", "/favorite/planet/%d" % planet, json={"user_id": user})
+    client.request("POST", "/favorite/planet/%d" % planet, json={"user_id": user})
+    client.request("POST", "/favorite/planet/%d" % planet, json={"user_id": other})
+    assert top_count(client, "planet", planet) == 2
+    client.request("DELETE", "/favorite/planet/%d" % planet, json={"user_id": other})
+    assert top_count(client, "planet", planet) == 1
+    client.request("DELETE", "/user/%d" % other)
+
+
+def test_top_is_ordered(client):
+    results = body(client.get("/favorites/top?type=character"))["result"]
+    counts = [row["favorites"] for row in results]
+    assert counts == sorted(counts, reverse=True)
+    assert client.get("/favorites/top?type=ship").status_code == 400
+
+
+def test_rebuild_restores_counters(session):
+    session.execute(update(FavoriteCount).values(count=42))
+    session.commit()
+    result = app.test_cli_runner().invoke(args=["rebuild-favorite-counts"])
+    assert result.exit_code == 0
+    assert "character: " in result.output
+    counts = {(row.target_type, row.target_id): row.count for row in session.scalars(select(FavoriteCount))}
+    # Seeded: user 1 likes character 1 and planet 1, user 2 likes specie 1
+    assert counts == {("character", 1): 1, ("planet", 1): 1, ("specie", 1): 1}
+
+
+def test_batch(client, user):
+    response = client.request("POST", "/user/%d/favorites/batch" % user, json=[
+        {"op": "add", "type": "character", "id": 7},
+        {"op": "add", "type": "planet", "id": 3},
+        {"op": "delete", "type": "planet", "id": 3},
+        {"op": "add", "type": "character", "id": 7},
+        {"op": "add", "type": "specie", "id": 999999},
+        {"op": "delete", "type": "character", "id": 8},
+        {"op": "fly", "type": "character", "id": 1},
+    ])
+    assert response.status_code == 200
+    results = body(response)["results"]
+    assert [result["status"] for result in results] == ["created", "cancelled", "deleted", "exists", "error", "error", "error"]
+    assert results[4]["error"] == "Not found: specie"
+    assert results[5]["error"] == "Favorite not found"
+    listed = body(client.get("/user/%d/favorites" % user))["result"]
+    assert [(favorite["character_id"], favorite["planet_id"]) for favorite in listed] == [(7, None)]
+    assert listed[0]["id"] == results[0]["id"]
+    assert top_count(client, "character", 7) == 1
+
+
+def test_batch_unknown_user(client):
+    response = client.request("POST", "/user/999999/favorites/batch", json=[{"op": "add", "type": "planet", "id": 1}])
+    assert response.status_code == 404
+
+
+def test_batch_conflict(client, user, monkeypatch):
+    # As if planet 999999 existed when checked and was deleted before the insert
+    monkeypatch.setattr(favorites, "existing_values", lambda column, ids: set(ids))
+    response = client.request("POST", "/user/%d/favorites/batch" % user, json=[
+        {"op": "add", "type": "planet", "id": 1}, {"op": "add", "type": "planet", "id": 999999}])
+    assert response.status_code == 409
+    assert body(client.get("/user/%d/favorites" % user))["result"] == []
@@ -0,0 +1,121 @@
+"""
+flask import-dump: record streaming, reference resolution and the load itself.
+"""
+import io
+import json
+import sqlite3
+import pytest
+from sqlalchemy import delete, select
+import importer
+from app import app
+from importer import json_records, csv_records, import_dump, next_id
+from models import db, User, Character, Planet, Specie
+
+
+def test_next_id_keeps_other_writers_out(session):
+    first = next_id(Planet)
+    assert first > session.execute(db.select(db.func.max(Planet.id))).scalar()
+    other = sqlite3.connect(db.engine.url.database, timeout=0.1)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            other.execute("INSERT INTO planet (name, clima) VALUES ('Raced', 'none')")
+        session.rollback()
+        other.execute("INSERT INTO planet (name, clima) VALUES ('Raced', 'none')")
+        other.rollback()
+    finally:
+        other.close()
+
+
+PLANETS = [{"name": "Tatooine", "climate": "arid", "url": "https://swapi.dev/api/planets/1/"},
+           {"name": "Alderaan", "climate": "temperate", "url": "https://swapi.dev/api/planets/2/"}]
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps(PLANETS),
+    "\n".join(json.dumps(record) for record in PLANETS) + "\n",
+    json.dumps({"count": 2, "next": None, "previous": None, "results": PLANETS}),
+    json.dumps({"count": 2, "results": PLANETS[:1], "next": {"page": 2}}) + "\n"
+    + json.dumps({"count": 2, "results": PLANETS[1:], "next": None}),
+    json.dumps({"meta": {"pages": [1]}, "results": PLANETS}),
+], ids=["array", "lines", "page", "pages", "page-after-object"])
+@pytest.mark.parametrize("read_size", [1, 7, 1 << 16])
+def test_json_records(monkeypatch, text, read_size):
+    monkeypatch.setattr(importer, "READ_SIZE", read_size)
+    assert list(json_records(io.StringIO(text))) == PLANETS
+
+
+def test_json_records_unterminated_page():
+    with pytest.raises(ValueError):
+        list(json_records(io.StringIO('{"count": 2, "results": [{"name": "Tatooine"}')))
+
+
+def test_csv_records_drop_empty_values():
+    text = "name,clima,url\nTatooine,arid,\nHoth,,x\n"
+    assert list(csv_records(io.StringIO(text))) == [{"name": "Tatooine", "clima": "arid"}, {"name": "Hoth", "url": "x"}]
+
+
+@pytest.fixture
+def imported():
+    """
+    Removes what the test imported, every row named "Imported ..." or "importer-...".
+    """
+    yield
+    with app.app_context():
+        for model in (Character, Specie, Planet, User):
+            db.session.execute(delete(model.__table__).where(model.name.like("Imported %") | model.name.like("importer-%")))
+        db.session.commit()
+
+
+def write(path, records):
+    path.write_text(json.dumps({"count": len(records), "next": None, "results": records}))
+    return str(path)
+
+
+def test_import_dump_command(tmp_path, flask_client, imported):
+    planets = write(tmp_path / "planets.json", [
+        {"name": "Imported Tatooine", "climate": "arid", "url": "https://swapi.dev/api/planets/1/"},
+        {"name": "Imported Nowhere"},
+    ])
+    species = tmp_path / "species.csv"
+    species.write_text("name,homeworld,url\n"
+                       "Imported Human,https://swapi.dev/api/planets/1/,https://swapi.dev/api/species/1/\n"
+                       "Imported Droid,Planet 2,https://swapi.dev/api/species/2/\n")
+    people = write(tmp_path / "people.json", [
+        {"name": "Imported Luke", "homeworld": "https://swapi.dev/api/planets/1/",
+         "species": ["https://swapi.dev/api/species/1/"]},
+        {"name": "Imported R2-D2", "homeworld": "Imported Tatooine", "species": ["https://swapi.dev/api/species/2"]},
+        {"name": "Imported Ghost", "homeworld": "https://swapi.dev/api/planets/99/", "species": []},
+        ["not", "an", "object"],
+    ])
+    etag = flask_client.get("/characters").headers["ETag"]
+
+    result = app.test_cli_runner().invoke(args=["import-dump", planets, str(species), people, "--batch-size", "1"])
+    assert result.exit_code == 0, result.output
+    assert "rejected record 2: missing clima" in result.output
+    assert "rejected record 3: homeworld 'https://swapi.dev/api/planets/99/' not found" in result.output
+    assert "rejected record 4: not an object" in result.output
+    assert "character: 2 rows loaded, 2 rejected" in result.output
+
+    response = flask_client.get("/characters?name=Imported&limit=100")
+    assert response.headers["ETag"] != etag
+    characters = {row["name"]: row for row in json.loads(response.body)["results"]}
+    assert sorted(characters) == ["Imported Luke", "Imported R2-D2"]
+    planet_id = characters["Imported Luke"]["planet_id"]
+    assert characters["Imported R2-D2"]["planet_id"] == planet_id
+    assert json.loads(flask_client.get("/planet/%d" % planet_id).body)["result"]["name"] == "Imported Tatooine"
+    droid = json.loads(flask_client.get("/specie/%d" % characters["Imported R2-D2"]["specie_id"]).body)["result"]
+    assert (droid["name"], droid["planet_id"]) == ("Imported Droid", 2)
+
+    # The database hands out the ids that follow the imported ones
+    created = flask_client.request("POST", "/planet", json={"name": "Imported Afterwards", "clima": "mild"})
+    assert json.loads(created.body)["planet"]["id"] > planet_id
+
+
+def test_import_users(session, imported):
+    stream = io.StringIO("name,email\nimporter-a,importer-a@example.com\nuser1,someone@example.com\n"
+                         "importer-b,user2@example.com\nimporter-a,other@example.com\nimporter-c,\n")
+    summary = import_dump("users", stream, "csv", batch_size=100)
+    assert (summary["table"], summary["loaded"], summary["rejected"]) == ("user", 1, 4)
+    assert summary["errors"] == ["record 2: user 'user1' already exists", "record 3: user 'importer-b' already exists",
+                                 "record 4: user 'importer-a' already exists", "record 5: missing email"]
+    assert session.execute(select(User.email).where(User.name == "importer-a")).scalar() == "importer-a@example.com"
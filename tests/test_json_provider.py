@@ -0,0 +1,46 @@
+"""
+The orjson provider writes the bytes of Flask's default provider, or hands the call back to it.
+"""
+import dataclasses
+import datetime
+import decimal
+import uuid
+import pytest
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from json_provider import OrjsonProvider, orjson
+
+pytestmark = pytest.mark.skipif(orjson is None, reason="orjson is not installed")
+
+
+@dataclasses.dataclass
+class Point:
+    y: int
+    x: str
+
+
+class Name(str):
+    pass
+
+
+VALUES = [
+    datetime.datetime(2024, 1, 2, 3, 4, 5), datetime.date(2024, 1, 2), Point(1, "a"), Name("n"),
+    1e16, 1e-7, 1e-5, float("nan"), float("inf"), -0.0, 0.5, 123.25, 9999999999999998.0,
+    uuid.UUID(int=5), decimal.Decimal("1.5"), 2 ** 70, "ñ", True, None,
+    {"b": [1e20, {"x": (1, 2.5)}], "a": None}, [{"id": 1, "name": "Luke"}, {"id": 2, "name": "Leia"}],
+]
+
+
+@pytest.fixture(scope="module")
+def providers():
+    app = Flask(__name__)
+    with app.app_context():
+        yield OrjsonProvider(app), DefaultJSONProvider(app)
+
+
+@pytest.mark.parametrize("value", VALUES, ids=repr)
+def test_same_bytes(providers, value):
+    fast, default = providers
+    body = {"value": value}
+    assert fast.dumps(body, separators=(",", ":")) == default.dumps(body, separators=(",", ":"))
+    assert fast.response(body).data == default.response(body).data
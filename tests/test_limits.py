@@ -0,0 +1,65 @@
+"""
+Admission control, on the Flask routes and on the async views of asgi.py,
+which share one Limiter.
+"""
+import json
+import threading
+import pytest
+from app import limiter
+from limiter import TokenBuckets
+
+
+@pytest.fixture
+def rate_limited(monkeypatch):
+    # A clock that never moves: one request per client, then a one second wait
+    monkeypatch.setattr(limiter, "buckets", {"scan": TokenBuckets(1, 1, 100, clock=lambda: 0.0)})
+
+
+@pytest.fixture
+def busy(monkeypatch):
+    # One "read" slot, held as if another request were running
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(limiter, "slots", {"read": slots})
+    slots.acquire()
+    yield
+    slots.release()
+
+
+def test_rate_limit(client, rate_limited):
+    assert client.get("/planets").status_code == 200
+    response = client.get("/planets")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert json.loads(response.body) == {"message": "Too many requests"}
+    # other groups keep their own buckets
+    assert client.get("/planet/1").status_code == 200
+
+
+def test_concurrency_limit(client, busy):
+    before = limiter.rejected[("read", "concurrency")]
+    response = client.get("/character/1")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert json.loads(response.body) == {"message": "Server busy, retry later"}
+    assert limiter.rejected[("read", "concurrency")] == before + 1
+    assert client.get("/characters").status_code == 200
+
+
+def test_exempt_endpoints(client, busy, rate_limited):
+    assert client.get("/metrics").status_code == 200
+    assert client.get("/healthz").status_code == 200
+
+
+def test_releases_slots(client):
+    before = limiter.admitted["scan"]
+    assert client.get("/species").status_code == 200
+    assert limiter.admitted["scan"] == before + 1
+    assert limiter.in_flight == {"write": 0, "scan": 0, "read": 0}
+
+
+def test_rejections_are_counted_in_metrics(client, metric, rate_limited):
+    line = 'http_requests_total{endpoint="get_favorites",method="GET",status="429"}'
+    before = metric(line)
+    client.get("/favorites")
+    client.get("/favorites")
+    assert metric(line) == before + 1
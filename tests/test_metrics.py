@@ -0,0 +1,36 @@
+"""
+Request metrics, recorded by the Flask routes and by the async views of asgi.py
+into the same registry.
+"""
+
+
+def test_counts_responses(client, metric):
+    line = 'http_requests_total{endpoint="get_planet",method="GET",status="200"}'
+    before = metric(line)
+    client.get("/planet/1")
+    client.get("/planet/2")
+    assert metric(line) == before + 2
+
+
+def test_counts_errors_by_status(client, metric):
+    line = 'http_requests_total{endpoint="get_specie",method="GET",status="404"}'
+    before = metric(line)
+    client.get("/specie/999")
+    assert metric(line) == before + 1
+
+
+def test_counts_statements(client, metric):
+    count = 'db_statements_per_request_count{endpoint="get_favorites"}'
+    total = 'db_statements_total{endpoint="get_favorites"}'
+    before = metric(count), metric(total)
+    client.get("/favorites?user_id=1")
+    assert metric(count) == before[0] + 1
+    # the table versions for the ETag, then the page
+    assert metric(total) >= before[1] + 2
+
+
+def test_latency_histogram(client, metric):
+    line = 'http_request_duration_seconds_count{endpoint="get_users"}'
+    before = metric(line)
+    client.get("/users")
+    assert metric(line) == before + 1
@@ -0,0 +1,99 @@
+"""
+The async views of asgi.py stand for Flask routes: same status, bytes and ETag.
+"""
+import json
+import pytest
+
+PATHS = [
+    "/users", "/characters", "/planets", "/species", "/favorites",
+    "/characters?limit=1", "/planets?fields=name", "/users?limit=0", "/species?after=!",
+    "/user/1", "/character/1", "/planet/1", "/specie/1", "/character/1?fields=name",
+    "/user/0", "/character/0", "/planet/0", "/specie/0", "/user/0/favorites",
+    "/user/1/favorites", "/user/1/favorites?limit=1&fields=planet_id",
+    "/characters?planet_id=1&fields=name", "/characters?specie_id=1&limit=2", "/species?planet_id=1",
+    "/planets?id__in=1,2,3", "/users?id__in=x", "/favorites?user_id=1&character_id=1",
+]
+
+
+def merged(headers):
+    # httpx joins repeated headers into one value, werkzeug keeps them apart
+    values = {}
+    for name, value in headers.items():
+        values.setdefault(name.lower(), []).append(value)
+    return {name: ", ".join(value) for name, value in values.items()}
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_same_response(flask_client, asgi_client, path):
+    expected = flask_client.get(path, Accept="application/json")
+    got = asgi_client.get(path, Accept="application/json")
+    assert got.status_code == expected.status_code
+    assert got.body == expected.body
+    assert got.headers.get("ETag") == expected.headers.get("ETag")
+
+
+@pytest.mark.parametrize("path", ["/characters", "/character/1", "/planet/0"])
+@pytest.mark.parametrize("headers", [{}, {"Origin": "http://example.com"}, {"Accept-Encoding": "gzip"},
+                                     {"Origin": "http://example.com", "Accept-Encoding": "gzip"}])
+def test_same_headers(flask_client, asgi_client, path, headers):
+    headers = dict(headers, Accept="application/json")
+    expected = flask_client.get(path, **headers)
+    got = asgi_client.get(path, **headers)
+    assert got.body == expected.body
+    assert merged(got.headers) == merged(expected.headers)
+
+
+def test_same_not_modified(flask_client, asgi_client):
+    etag = flask_client.get("/characters", Accept="application/json").headers["ETag"]
+    headers = {"Accept": "application/json", "Origin": "http://example.com", "If-None-Match": etag}
+    expected = flask_client.get("/characters", **headers)
+    got = asgi_client.get("/characters", **headers)
+    assert (got.status_code, merged(got.headers)) == (expected.status_code, merged(expected.headers))
+
+
+@pytest.mark.parametrize("path", ["/characters", "/character/1", "/user/1/favorites?limit=1"])
+def test_not_modified(client, path):
+    first = client.get(path)
+    assert first.status_code == 200
+    second = client.get(path, **{"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 304
+    assert second.body == b""
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_collection_envelope(client):
+    body = json.loads(client.get("/characters?limit=2&fields=name").body)
+    assert [result["name"] for result in body["results"]] == ["Character 1", "Character 2"]
+    assert set(body["results"][0]) == {"id", "name"}
+    page = json.loads(client.get("/characters?limit=2&after=" + body["next"]).body)
+    assert [result["name"] for result in page["results"]] == ["Character 3", "Character 4"]
+
+
+def test_detail_not_found(client):
+    response = client.get("/planet/999")
+    assert response.status_code == 404
+    assert json.loads(response.body) == {"error": "Planeta no encontrado"}
+    assert "ETag" not in response.headers
+
+
+def test_unknown_user_favorites(client):
+    response = client.get("/user/999/favorites")
+    assert response.status_code == 404
+
+
+def test_invalid_filter(client):
+    assert client.get("/users?id__in=x").status_code == 400
+
+
+def test_write_changes_etag(client):
+    before = client.get("/planets")
+    created = client.request("POST", "/planet", json={"name": "Hoth", "clima": "frozen"})
+    assert created.status_code == 201
+    planet_id = json.loads(created.body)["planet"]["id"]
+    try:
+        after = client.get("/planets", **{"If-None-Match": before.headers["ETag"]})
+        assert after.status_code == 200
+        assert after.headers["ETag"] != before.headers["ETag"]
+        assert json.loads(client.get("/planet/%d" % planet_id).body)["result"]["name"] == "Hoth"
+    finally:
+        client.request("DELETE", "/planet/%d" % planet_id)
@@ -0,0 +1,119 @@
+"""
+GET /search and the ?name= filter of the collections, on LIKE (a create_all
+database) and on the FTS5 trigram tables of migration 7d2f5b8c1a64.
+"""
+import importlib.util
+import json
+import os
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from sqlalchemy import delete
+import search
+from app import app
+from models import db, Character, Planet, Specie
+
+MIGRATION = os.path.join(os.path.dirname(__file__), "..", "migrations", "versions", "7d2f5b8c1a64_name_search.py")
+
+SKYWALKERS = [
+    ("character", "Skywalker"),
+    ("specie", "Skywalkers"),
+    ("planet", "Skywalker Ranch"),
+    ("character", "Luke Skywalker"),
+    ("character", "Anakin Skywalker"),
+    ("character", "Shmi Skywalker Lars"),
+]
+
+
+def body(response):
+    return json.loads(response.body)
+
+
+def found(response):
+    return [(result["type"], result["name"]) for result in body(response)["results"]]
+
+
+def run_migration(step):
+    spec = importlib.util.spec_from_file_location("name_search", MIGRATION)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    with app.app_context(), db.engine.begin() as connection:
+        with Operations.context(MigrationContext.configure(connection)):
+            getattr(module, step)()
+    search._fts_tables.clear()
+
+
+@pytest.fixture(scope="module")
+def names():
+    with app.app_context():
+        rows = [Planet(name="Skywalker Ranch", clima="dry"), Planet(name="Moon 50% off", clima="cold"),
+                Planet(name="Moon 500", clima="cold"), Specie(name="Skywalkers", planet_id=1)]
+        rows += [Character(name=name, planet_id=1, specie_id=1)
+                 for kind, name in SKYWALKERS if kind == "character"]
+        db.session.add_all(rows)
+        db.session.commit()
+        created = [(type(row), row.id) for row in rows]
+    yield
+    with app.app_context():
+        for model, row_id in created:
+            db.session.execute(delete(model).where(model.id == row_id))
+        db.session.commit()
+
+
+@pytest.fixture(scope="module", params=["like", "fts"])
+def index(request, names):
+    if request.param == "fts":
+        run_migration("upgrade")
+    yield request.param
+    if request.param == "fts":
+        run_migration("downgrade")
+
+
+def test_ranking(client, index):
+    response = client.get("/search?q=skywalker")
+    assert response.status_code == 200
+    assert body(response)["q"] == "skywalker"
+    assert found(response) == SKYWALKERS
+    assert found(client.get("/search?q=SKYWALKER")) == SKYWALKERS
+
+
+def test_types_and_limit(client, index):
+    assert found(client.get("/search?q=skywalker&type=character,planet&limit=2")) == [
+        ("character", "Skywalker"), ("planet", "Skywalker Ranch")]
+    assert found(client.get("/search?q=walker&type=specie")) == [("specie", "Skywalkers")]
+
+
+def test_wildcards_are_literal(client, index):
+    assert found(client.get("/search?q=50%25")) == [("planet", "Moon 50% off")]
+    assert found(client.get("/search?q=n_5")) == []
+
+
+def test_name_filter(client, index):
+    response = client.get("/characters?name=walker&limit=100")
+    assert response.status_code == 200
+    assert sorted(row["name"] for row in body(response)["results"]) == [
+        "Anakin Skywalker", "Luke Skywalker", "Shmi Skywalker Lars", "Skywalker"]
+    assert [row["name"] for row in body(client.get("/planets?name=moon 5&limit=100"))["results"]] == [
+        "Moon 50% off", "Moon 500"]
+
+
+def test_rows_written_after_indexing_are_found(client, index):
+    created = client.request("POST", "/planet", json={"name": "Tatooine Skywalker Farm", "clima": "arid"})
+    planet_id = body(created)["planet"]["id"]
+    try:
+        assert ("planet", "Tatooine Skywalker Farm") in found(client.get("/search?q=skywalker&type=planet"))
+    finally:
+        client.request("DELETE", "/planet/%d" % planet_id)
+    assert ("planet", "Tatooine Skywalker Farm") not in found(client.get("/search?q=skywalker&type=planet"))
+
+
+@pytest.mark.parametrize("path", [
+    "/search",
+    "/search?q=ab",
+    "/search?q=%20ab%20",
+    "/search?q=" + "x" * 101,
+    "/search?q=skywalker&type=ship",
+    "/characters?name=ab",
+])
+def test_rejected_queries(client, path):
+    assert client.get(path).status_code == 400